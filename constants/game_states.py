@@ -0,0 +1,14 @@
+LOBBY = 0
+INTRO = 1
+PLAYING = 2
+OVER = 3
+DISPOSED = 4
+
+# Allowed state transitions
+TRANSITIONS = {
+    LOBBY: (INTRO, DISPOSED),
+    INTRO: (PLAYING, OVER, DISPOSED),
+    PLAYING: (INTRO, OVER, DISPOSED),
+    OVER: (DISPOSED,),
+    DISPOSED: ()
+}
@@ -0,0 +1,11 @@
+# Wire protocol versions, negotiated on connect with the `protocol` query string parameter
+V1 = 1
+V2 = 2      # grids as positional lists with type codes, commands by element index
+
+DEFAULT = V1
+SUPPORTED = (V1, V2)
+
+# First version that receives the events of the same event loop turn in a single `batch` event.
+# Its data is the list of the events in emit order, each one as an `[event]` or `[event, data]` list:
+# `["batch", [["command", {...}], ["next_level", {...}]]]`. Older versions get the events one by one.
+BATCH = V2
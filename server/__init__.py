@@ -1,22 +1,44 @@
 import logging
+from urllib.parse import parse_qs
 
+import exceptions
+from constants import protocols
 from server.client import Client
 from server.game import Game
+from singletons.admission import Admission
 from singletons.client_manager import ClientManager
 from singletons.lobby_manager import LobbyManager
+from singletons.outbox import Outbox
 from singletons.sio import Sio
+from singletons.words_storage import WordsStorage
 from utils import server
 
 sio = Sio()
 
+BUSY_MESSAGE = "Il server è sovraccarico, riprova tra qualche minuto"
+
+COMMAND_BY_NAME = server.Schema(("name", str))
+COMMAND_BY_INDEX = server.Schema(("index", int))
+
 # TODO: some of these raise uncaught runtime errors in akerino edge cases
 
 
 @sio.on("connect")
 async def connect(sid, environ):
-    c = Client(sid)
+    # Refuse the connection if the server is saturated
+    reason = Admission().check_connection()
+    if reason is not None:
+        logging.warning("Refused connection from {} ({})".format(sid, reason))
+        return False
+
+    # Protocol negotiation. Clients that don't ask for a supported version get the default one.
+    protocol = protocols.DEFAULT
+    requested = parse_qs(environ.get("QUERY_STRING", "")).get("protocol")
+    if requested and requested[0].isdigit() and int(requested[0]) in protocols.SUPPORTED:
+        protocol = int(requested[0])
+    c = Client(sid, protocol)
     ClientManager().add_client(c)
-    await sio.emit("welcome", {"uid": c.uid}, room=sid)
+    await sio.emit("welcome", {"uid": c.uid, "protocol": c.protocol}, room=sid)
     logging.info("{} connected".format(c.uid))
 
 
@@ -32,13 +54,20 @@ async def disconnect(sid, data, client):
         return
 
 
-@sio.on("create_game")
-@server.base
-@server.link_client
-@server.client_not_in_game
-@server.args(("name", str), ("public", bool))
+@server.handler("create_game", guard=server.NOT_IN_GAME, args=[("name", str), ("public", bool)])
 async def create_game(sid, data, client):
-    match = Game(name=data["name"], public=data["public"])
+    reason = Admission().check_new_game()
+    if reason is not None:
+        logging.warning("{} can't create a game, the server is busy ({})".format(sid, reason))
+        await sio.emit("game_join_fail", {
+            "message": BUSY_MESSAGE,
+            "busy": True
+        }, room=sid)
+        return
+    locale = None
+    if "locale" in data and data["locale"] in WordsStorage().available_locales():
+        locale = data["locale"]
+    match = Game(name=data["name"], public=data["public"], locale=locale)
     await LobbyManager().add_game(match)
     try:
         await match.join_client(client)
@@ -47,45 +76,56 @@ async def create_game(sid, data, client):
         return
 
 
-@sio.on("join_lobby")
-@server.base
-@server.link_client
+@server.handler("join_lobby")
 async def join_lobby(sid, data, client):
     sio.enter_room(client.sid, "lobby")
-    for _, g in LobbyManager().items():
-        if g.public and not g.playing:
-            await sio.emit("lobby_info", g.sio_lobby_info(), room=sid)
+    await sio.emit("lobby_snapshot", LobbyManager().snapshot(), room=sid)
     logging.info("{} joined lobby".format(sid))
 
 
-@sio.on("leave_lobby")
-@server.base
-@server.link_client
+@server.handler("lobby_query")
+async def lobby_query(sid, data, client):
+    data = data if type(data) is dict else {}
+    name = data.get("name", "")
+    free_slots = data.get("free_slots", 0)
+    after = data.get("after", None)
+    limit = data.get("limit", LobbyManager().DEFAULT_PAGE_SIZE)
+    if type(name) is not str \
+            or type(free_slots) is not int \
+            or type(limit) is not int \
+            or (after is not None and type(after) is not int):
+        raise exceptions.SocketInvalidArgumentsError()
+    games, next_cursor = LobbyManager().query(
+        name_prefix=name.strip(),
+        min_free_slots=free_slots,
+        after=after,
+        limit=limit
+    )
+    await sio.emit("lobby_query_result", {
+        "version": LobbyManager().version,
+        "games": games,
+        "next": next_cursor
+    }, room=sid)
+
+
+@server.handler("leave_lobby")
 async def leave_lobby(sid, data, client):
     sio.leave_room(client.sid, "lobby")
     logging.info("{} left lobby".format(sid))
 
 
-@sio.on("join_game")
-@server.base
-@server.link_client
-@server.client_not_in_game
-@server.args(("game_id", str))
+@server.handler("join_game", guard=server.NOT_IN_GAME, args=[("game_id", str)])
 async def join_game(sid, data, client):
     if data["game_id"].lower() not in LobbyManager():
         logging.warning("{} tried to enter unknown game {}".format(sid, data["game_id"]))
         await sio.emit("game_join_fail", {
             "message": "Partita non trovata"
-        })
+        }, room=sid)
     else:
         await LobbyManager()[data["game_id"]].join_client(client)
 
 
-@sio.on("change_game_settings")
-@server.base
-@server.link_client
-@server.client_in_game
-@server.client_is_host
+@server.handler("change_game_settings", guard=server.IN_GAME, host=True)
 async def change_game_settings(sid, data, client):
     kwargs = {}
     if "size" in data and type(data["size"]) is int:
@@ -95,69 +135,66 @@ async def change_game_settings(sid, data, client):
     await client.game.update_settings(**kwargs)
 
 
-@sio.on("ready")
-@server.base
-@server.link_client
-@server.client_in_game
+@server.handler("ready", guard=server.IN_GAME, rate_limit_name="READY")
 async def toggle_ready(sid, _, client):
     await client.game.ready(client)
 
 
-@sio.on("leave_game")
-@server.base
-@server.link_client
-@server.client_in_game
+@server.handler("game_resync", guard=server.IN_GAME)
+async def game_resync(sid, _, client):
+    await client.game.notify_game(client)
+
+
+@server.handler("leave_game", guard=server.IN_GAME)
 async def leave_game(sid, _, client):
     await client.leave_game()
 
 
-@sio.on("start_game")
-@server.base
-@server.link_client
-@server.client_in_game
-@server.client_is_host
+@server.handler("start_game", guard=server.IN_GAME, host=True)
 async def start_game(sid, _, client):
+    reason = Admission().check_game_start()
+    if reason is not None:
+        logging.warning("{} game can't start, the server is busy ({})".format(client.game.uuid, reason))
+        # Everyone in the game is waiting for it to start
+        await Outbox().emit("game_start_fail", {
+            "message": BUSY_MESSAGE,
+            "busy": True
+        }, room=client.game.sio_room)
+        return
     try:
         await client.game.start()
     except RuntimeError:
         logging.warning("{} game wanted to start, but requirements arent met".format(client.game.uuid))
 
 
-@sio.on("intro_done")
-@server.base
-@server.link_client
-@server.client_in_game_in_progress
+@server.handler("intro_done", guard=server.IN_GAME_IN_PROGRESS)
 async def intro_done(sid, _, client):
     await client.game.intro_done(client)
 
 
-@sio.on("command")
-@server.base
-@server.link_client
-@server.client_in_game_in_progress
-@server.args(("name", str))
+@server.handler("command", guard=server.IN_GAME_IN_PROGRESS, rate_limit_name="COMMAND")
 async def command(sid, data, client):
-    print("Got", data)
+    # Protocol v2 clients send the element index instead of its name
+    if client.protocol == protocols.V2:
+        COMMAND_BY_INDEX.validate(data)
+        command_id = data["index"]
+    else:
+        COMMAND_BY_NAME.validate(data)
+        command_id = data["name"]
     try:
-        await client.game.do_command(client, data["name"], data["value"] if "value" in data else None)
+        await client.game.do_command(client, command_id, data["value"] if "value" in data else None)
     except ValueError:
         # Invalid command
         pass
 
 
-@sio.on("defeat_asteroid")
-@server.base
-@server.link_client
-@server.client_in_game_in_progress
-async def command(sid, data, client):
+@server.handler("defeat_asteroid", guard=server.IN_GAME_IN_PROGRESS, rate_limit_name="DEFEAT")
+async def defeat_asteroid(sid, data, client):
     logging.debug("Got an asteroid!")
     await client.game.defeat_special(client, False)
 
 
-@sio.on("defeat_black_hole")
-@server.base
-@server.link_client
-@server.client_in_game_in_progress
-async def command(sid, data, client):
+@server.handler("defeat_black_hole", guard=server.IN_GAME_IN_PROGRESS, rate_limit_name="DEFEAT")
+async def defeat_black_hole(sid, data, client):
     logging.debug("Got a black hole!")
     await client.game.defeat_special(client, True)
@@ -1,14 +1,21 @@
-from constants import client_statuses
+import collections
+
+from constants import client_statuses, protocols
 from singletons.client_manager import ClientManager
 
 
 class Client:
-    def __init__(self, sid):
+    def __init__(self, sid, protocol=protocols.DEFAULT):
         self.sid = sid
         self.uid = ClientManager().next_uid()
         self.status = client_statuses.NONE
+        self.protocol = protocol
         self._game = None
 
+        # Rate limiting, `TokenBucket` objects and refused events by event name
+        self.rate_limits = {}
+        self.throttled = collections.Counter()
+
     async def dispose(self):
         # Leave joined game
         await self.leave_game()
@@ -1,15 +1,20 @@
-import asyncio
 import logging
 import random
 
+from constants import game_states
 from server import Client
 from server.game_modifiers import FlipGrid, Symbols, BlackHolesField, AsteroidsField, Alien
+from server.health import Health
 from server.instruction import Instruction
+from server.instruction_templates import catalog
 from singletons.config import Config
+from singletons.grid_pool import GridPool
 from singletons.lobby_manager import LobbyManager
+from singletons.metrics import Metrics
+from singletons.outbox import Outbox
+from singletons.scheduler import Scheduler
 from singletons.sio import Sio
-from utils.command_name_generator import CommandNameGenerator
-from utils.grid import Grid, Button, SliderLikeElement, Actions, Switch, GridElement
+from utils.grid import Button, SliderLikeElement, Actions, Switch
 from utils.special_commands import DummyAsteroidCommand, DummyBlackHoleCommand, SpecialCommand
 
 
@@ -22,10 +27,12 @@ class Slot:
 
         self.grid = None
         self.instruction = None
-        self.next_generation_task = None
+        self.next_generation_timer = None
 
-        self.defeating_asteroid = False
-        self.defeating_black_hole = False
+        # Loop times until the asteroid/black hole defeat windows are open, and their closing timers
+        self.defeating_asteroid_until = 0
+        self.defeating_black_hole_until = 0
+        self.defeat_window_timers = {False: None, True: None}
 
         self.special_command_cooldown = 0
 
@@ -36,42 +43,62 @@ class Slot:
             "host": self.host
         }
 
-    async def reset_asteroid(self, after=2):
-        await asyncio.sleep(after)
-        self.defeating_asteroid = False
+    def cancel_timers(self):
+        """
+        Cancels the command generation and defeat window timers of this slot
+        :return:
+        """
+        if self.next_generation_timer is not None:
+            self.next_generation_timer.cancel()
+        for timer in self.defeat_window_timers.values():
+            if timer is not None:
+                timer.cancel()
 
-    async def reset_black_hole(self, after=2):
-        await asyncio.sleep(after)
-        self.defeating_black_hole = False
+    def defeating_until(self, black_hole):
+        return self.defeating_black_hole_until if black_hole else self.defeating_asteroid_until
+
+    def set_defeating_until(self, black_hole, until):
+        if black_hole:
+            self.defeating_black_hole_until = until
+        else:
+            self.defeating_asteroid_until = until
 
 
 class Game:
     STARTING_HEALTH = 50
-    HEALTH_LOOP_RATE = 2
+    DEFEAT_WINDOW = 2
     MAX_PLAYERS = 4
 
-    def __init__(self, name, public):
+    def __init__(self, name, public, locale=None):
         self._uuid = None   # implemented as a property
 
         self.name = name
+        self.locale = locale    # words locale, `None` for the default one
 
         self.public = public
         self.max_players = 2
 
         self.slots = []
-        self.playing = False
-        self.disposing = False
-        self.instructions = []
+        self.state = game_states.LOBBY
+
+        # Sequence number of the last `game_delta` event
+        self.delta_sequence = 0
+
+        # Active instructions by (target command, expected value) and special instructions by command type
+        self.instructions = {}
+        self.special_instructions = {DummyAsteroidCommand: set(), DummyBlackHoleCommand: set()}
+
+        # Number of slots with an open asteroid (False) and black hole (True) defeat window
+        self.defeating_slots = {False: 0, True: 0}
 
         self.level = -1
-        self.health = self.STARTING_HEALTH
-        self.death_limit = 0
+        self.health = Health(self.STARTING_HEALTH)
 
-        self.health_drain_task = None
+        self.game_over_timer = None
+        self.warmup_timer = None
 
         self.previous_game_modifier = None
         self.game_modifier = None
-        self.game_modifier_task = None
 
         self.difficulty = {
             "instructions_time": 25,                        # seconds to complete an instruction
@@ -87,6 +114,34 @@ class Game:
         }
         self.vanilla_difficulty = self.difficulty
 
+    @property
+    def playing(self):
+        """
+        :return: `True` if the game is in progress (intro or playing)
+        """
+        return self.state in (game_states.INTRO, game_states.PLAYING)
+
+    @property
+    def started(self):
+        """
+        :return: `True` if the game has left the lobby state
+        """
+        return self.state != game_states.LOBBY
+
+    def set_state(self, state):
+        """
+        Changes the game state
+        :param state: new state, one of `constants.game_states`
+        :return:
+        """
+        if state not in game_states.TRANSITIONS[self.state]:
+            raise RuntimeError("Invalid game state transition ({} -> {})".format(self.state, state))
+        logging.debug("{} state {} -> {}".format(self.uuid, self.state, state))
+        was_playing = self.playing
+        self.state = state
+        if self.playing != was_playing:
+            LobbyManager().games_in_progress += 1 if self.playing else -1
+
     @property
     def uuid(self):
         """
@@ -112,7 +167,7 @@ class Game:
         :param client: `Client` object
         :return:
         """
-        if self.playing:
+        if self.started:
             raise RuntimeError("The game is in progress!")
         if type(client) is not Client:
             raise TypeError("`client` must be a Client object")
@@ -121,7 +176,7 @@ class Game:
 
         # Make sure the room is not completely full
         if len(self.slots) >= self.max_players:
-            await Sio().emit("game_join_fail", {
+            await Outbox().emit("game_join_fail", {
                 "message": "La partita è piena"
             }, room=client.sid)
             return
@@ -136,14 +191,13 @@ class Game:
         await client.join_game(self)
 
         # Notify joined client
-        await Sio().emit("game_join_success", {
+        await Outbox().emit("game_join_success", {
             "game_id": self.uuid
         }, room=client.sid)
 
-        # Notify other clients (if this is not the first one joining aka the one creating the room)
-        # await Sio().emit("client_joined", room=self.sio_room, skip_sid=client.sid)
-        if len(self.slots) > 0:
-            await self.notify_game()
+        # Send the new slot to the other clients and the full game info to the joined one
+        await self.notify_game_delta(slots=[self.slots[-1]], skip_client=client)
+        await self.notify_game(client)
 
         # Notify lobby if public
         await self.notify_lobby()
@@ -177,27 +231,30 @@ class Game:
 
         # Remove the client
         self.slots.remove(slot_to_remove)
+        slot_to_remove.cancel_timers()
 
         # Leave sio room
         Sio().leave_room(client.sid, self.sio_room)
 
-        if self.playing and not self.disposing:
+        if self.playing:
             # If we are in game, disconnect everyone
             try:
-                await Sio().emit('player_disconnected', room=self.sio_room)
+                await Outbox().emit('player_disconnected', room=self.sio_room)
                 await self.dispose()
             except RuntimeError:
                 # Already disposing
                 pass
-        elif not self.playing:
+        elif self.state == game_states.LOBBY:
             # Choose another host if host left
+            changed_slots = []
             if slot_to_remove.host and len(self.slots) > 0:
                 new_host = random.choice(self.slots)
                 new_host.host = True
+                changed_slots.append(new_host)
                 logging.info("{} chosen as new host in game {}".format(client.sid, self.uuid))
 
             # Notify other clients
-            await self.notify_game()
+            await self.notify_game_delta(slots=changed_slots, removed=[slot_to_remove])
 
             # Notify lobby
             await self.notify_lobby()
@@ -218,15 +275,43 @@ class Game:
 
     async def notify_lobby(self):
         if self.public:
-            await Sio().emit("lobby_info", self.sio_lobby_info(), room="lobby")
+            LobbyManager().mark_dirty(self)
 
-    async def notify_game(self):
-        await Sio().emit("game_info", self.sio_game_info(), room=self.sio_room)
+    async def notify_game(self, client=None):
+        """
+        Sends the full game info (`game_info` event)
+        :param client: `Client` object. If `None`, send it to the whole game.
+        :return:
+        """
+        await Outbox().emit("game_info", self.sio_game_info(), room=self.sio_room if client is None else client.sid)
+
+    async def notify_game_delta(self, slots=(), removed=(), settings=False, skip_client=None):
+        """
+        Sends only what changed in the game (`game_delta` event), with a sequence number.
+        Clients that see a gap in the sequence numbers ask for the full game info (`game_resync` event).
+        :param slots: `Slot`s that have been added or changed
+        :param removed: `Slot`s that have been removed
+        :param settings: `True` to send the game settings too
+        :param skip_client: `Client` that won't receive the event, if any
+        :return:
+        """
+        self.delta_sequence += 1
+        delta = {"sequence": self.delta_sequence}
+        if slots:
+            delta["slots"] = [x.sio_slot_info() for x in slots]
+        if removed:
+            delta["removed"] = [x.client.uid for x in removed]
+        if settings:
+            delta["settings"] = {
+                "max_players": self.max_players,
+                "public": self.public
+            }
+        await Outbox().emit(
+            "game_delta", delta, room=self.sio_room, skip_sid=skip_client.sid if skip_client is not None else None
+        )
 
     async def notify_lobby_dispose(self):
-        await Sio().emit("lobby_disposed", {
-            "game_id": self.uuid
-        }, room="lobby")
+        LobbyManager().mark_disposed(self)
 
     def sio_lobby_info(self):
         return {
@@ -238,9 +323,17 @@ class Game:
         }
 
     def sio_game_info(self):
-        return {**self.sio_lobby_info(), **{
-            "slots": [x.sio_slot_info() for x in self.slots] + [None] * (self.max_players - len(self.slots))
-        }}
+        slots = [x.sio_slot_info() for x in self.slots]
+        slots.extend([None] * (self.max_players - len(self.slots)))
+        return {
+            "name": self.name,
+            "game_id": self.uuid,
+            "players": len(self.slots),
+            "max_players": self.max_players,
+            "public": self.public,
+            "slots": slots,
+            "sequence": self.delta_sequence
+        }
 
     def get_host(self):
         """
@@ -270,7 +363,7 @@ class Game:
         :param public: new public status (True/False). Use `None` to leave untouched.
         :return:
         """
-        if self.playing:
+        if self.started:
             raise RuntimeError("Game in progress!")
         visibility_changed = False
         if size is not None and 2 <= size <= self.MAX_PLAYERS:
@@ -278,7 +371,7 @@ class Game:
         if public is not None:
             self.public = public
             visibility_changed = True
-        await self.notify_game()
+        await self.notify_game_delta(settings=True)
 
         if self.public:
             # If the game is public, always send updated info to lobby
@@ -294,13 +387,13 @@ class Game:
         :param client: `Client` object
         :return:
         """
-        if self.playing:
+        if self.started:
             raise RuntimeError("Game in progress!")
         slot = self.get_slot(client)
         if slot is None:
             raise ValueError("Client not in match")
         slot.ready = not slot.ready
-        await self.notify_game()
+        await self.notify_game_delta(slots=[slot])
 
     async def start(self):
         """
@@ -309,7 +402,7 @@ class Game:
         """
         if len(self.slots) > 1 and all([x.ready for x in self.slots]) or Config()["SINGLE_PLAYER"]:
             # Game starts
-            self.playing = True
+            self.set_state(game_states.INTRO)
 
             # Remove game from lobby
             await self.notify_lobby_dispose()
@@ -318,7 +411,7 @@ class Game:
             await self.next_level()
 
             # Notify all clients
-            await Sio().emit("game_started", room=self.sio_room)
+            await Outbox().emit("game_started", room=self.sio_room)
         else:
             raise RuntimeError("Conditions not met for game to start")
 
@@ -328,25 +421,23 @@ class Game:
         sets game modifiera and generates new grids
         :return:
         """
-        # Stop drain loop task
-        if self.health_drain_task is not None:
-            self.health_drain_task.cancel()
+        # Stop all timers (game over, game modifier, warmup and command generation loop)
+        self.cancel_timers()
 
-        # Stop game modifier task
-        if self.game_modifier_task is not None:
-            self.game_modifier_task.cancel()
+        # Play the intro again
+        if self.state != game_states.INTRO:
+            self.set_state(game_states.INTRO)
 
-        # Stop all command generation loop tasks
-        for slot in self.slots:
-            if slot.next_generation_task is not None:
-                slot.next_generation_task.cancel()
+        # Forget the previous level's instructions
+        self.instructions.clear()
+        for x in self.special_instructions.values():
+            x.clear()
 
         # Go to next level
         self.level += 1
 
         # Reset health and death limit
-        self.health = self.STARTING_HEALTH
-        self.death_limit = 0
+        self.health.reset(self.STARTING_HEALTH)
 
         # Change difficulty settings if this is not the first level
         if self.level > 0:
@@ -399,28 +490,41 @@ class Game:
         # Generate grids
         await self.generate_grids()
 
-        # Start game modifier task if needed
+        # Start game modifier timer if needed
         if self.game_modifier is not None:
-            self.game_modifier_task = asyncio.Task(self.game_modifier.task())
+            self.game_modifier.start()
+
+    def cancel_timers(self):
+        """
+        Cancels every scheduled timer of this game
+        (warmup, game over, game modifier, command generation and defeat windows)
+        :return:
+        """
+        if self.warmup_timer is not None:
+            self.warmup_timer.cancel()
+        if self.game_over_timer is not None:
+            self.game_over_timer.cancel()
+        if self.game_modifier is not None:
+            self.game_modifier.stop()
+        for slot in self.slots:
+            slot.cancel_timers()
 
     async def generate_grids(self):
         """
-        Generates new `Grid`s for all clients
+        Assigns new `Grid`s, taken from the grid pool, to all clients
         :return:
         """
         if not self.playing:
             raise RuntimeError("Game not in progress!")
-        name_generator = CommandNameGenerator()
-
-        for slot in self.slots:
-            g = Grid(name_generator)
 
+        for slot, g in zip(self.slots, GridPool().get(len(self.slots), self.locale)):
             # Game modifier post processor if needed
             if self.game_modifier is not None:
                 try:
                     self.game_modifier.grid_post_processor(g)
                 except NotImplementedError:
                     pass
+                g.invalidate()
 
             slot.grid = g
 
@@ -437,6 +541,10 @@ class Game:
         if slot is None:
             raise ValueError("Client not in match")
 
+        # Duplicate intro done, the level has already started
+        if self.state != game_states.INTRO:
+            return
+
         # This client has played the intro
         slot.intro_done = True
 
@@ -452,33 +560,45 @@ class Game:
         This emits to all clients their `grid` event and the first `command` event
         :return:
         """
+        self.set_state(game_states.PLAYING)
+
         # Notify each client about their grid if eveyone has completed intro
         for slot in self.slots:
-            await Sio().emit("grid", slot.grid.__dict__(), room=slot.client.sid)
+            await Outbox().emit("grid", slot.grid.encoded_payload(slot.client.protocol), room=slot.client.sid)
 
         # Warmup dummy instruction
         warmup_time = max(int(self.difficulty["instructions_time"] / 5), 3)
-        await Sio().emit("command", {
-            "text": "Prepararsi a ricevere istruzioni",
+        await Outbox().emit("command", {
+            "text": catalog(self.locale).warmup,
             "time": warmup_time
         }, room=self.sio_room)
 
-        # Wait until the dummy instruction expires
-        await asyncio.sleep(warmup_time)
+        # Start playing when the dummy instruction expires
+        self.warmup_timer = Scheduler().call_later(warmup_time, self.warmup_done)
+
+    async def warmup_done(self):
+        """
+        Called when the warmup dummy instruction expires.
+        Generates the first command for each slot and starts the health drain
+        :return:
+        """
+        if not self.playing:
+            return
 
         # Generate first command for each slot, starting the regeneration loop as well
         for slot in self.slots:
             await self.generate_instruction(slot)
 
-        # Star the health drain task too
-        self.health_drain_task = asyncio.Task(self.health_drain_loop())
+        # Start draining health too
+        self.health.start(self.difficulty["health_drain_rate"], self.difficulty["death_limit_increase_rate"])
+        await self.health_changed()
 
     async def generate_instruction(self, slot, expired=None, stop_old_task=True):
         """
         Generates and sets a valid and unique Instruction for `Slot` and schedules
-        an asyncio Task to run
+        its expiration
         :param slot: `Slot` object that will be the target of that instruction
-        :param stop_old_task: if `True`, stop the old generation task.
+        :param stop_old_task: if `True`, stop the old generation timer.
                               Set to `False` if running in the generation loop, `True` if calling from outside the loop.
         :param expired: Send this to the client with the new instruction.
                         If `True`, the old instruction expired.
@@ -487,9 +607,9 @@ class Game:
                         The client will play sounds and visual fx accordingly.
         :return:
         """
-        # Stop the old next generation task if needed
-        if slot.next_generation_task is not None and stop_old_task:
-            slot.next_generation_task.cancel()
+        # Stop the old next generation timer if needed
+        if slot.next_generation_timer is not None and stop_old_task:
+            slot.next_generation_timer.cancel()
         old_instruction = slot.instruction
 
         # Choose between an asteroid/black hole or normal command
@@ -525,92 +645,142 @@ class Game:
 
         # Generate a command if needed
         if command is None:
-            # Find a random command that is not used in any other instructions at the moment and is not the same as the
-            # previous one
-            valid_command = False
-            while not valid_command:
-                valid_command = True
-                command = random.choice(target.grid.objects)
-                print(self.instructions + [slot.instruction])
-                print(slot.instruction)
-                for x in self.instructions + [slot.instruction]:
-                    # x is `None` if slot.instructions is None (first generation)
-                    if x is not None and x.target_command == command:
-                        valid_command = False
-                        break
+            target, command = self.take_free_command(slot, target)
+
+        # The old command can be picked again from now on
+        if old_instruction is not None and old_instruction.target is not None:
+            old_instruction.target.grid.release_object(old_instruction.target_command)
 
         # Set this slot's instruction and notify the client
-        slot.instruction = Instruction(slot, target, command)
+        slot.instruction = Instruction(slot, target, command, self.locale)
 
         # Add new one
-        self.instructions.append(slot.instruction)
+        self.add_instruction(slot.instruction)
+        Metrics().instructions.inc("issued")
 
         # Notify the client about the new command and the status of the old command
-        await Sio().emit("command", {
+        await Outbox().emit("command", {
             "text": slot.instruction.text,
             "time": self.difficulty["instructions_time"],
             "expired": expired,
         }, room=slot.client.sid)
 
         if old_instruction is not None and issubclass(type(old_instruction.target_command), SpecialCommand):
-            await Sio().emit("safe", room=self.sio_room)
+            await Outbox().emit("safe", room=self.sio_room)
 
-        # Schedule a new generation
-        slot.next_generation_task = asyncio.Task(self.schedule_generation(slot, self.difficulty["instructions_time"]))
+        # Schedule a new generation, reusing the slot's timer handle
+        if slot.next_generation_timer is None:
+            slot.next_generation_timer = Scheduler().call_later(
+                self.difficulty["instructions_time"], self.schedule_generation, slot
+            )
+        else:
+            Scheduler().reschedule(slot.next_generation_timer, self.difficulty["instructions_time"])
 
-    async def schedule_generation(self, slot, seconds):
+    def take_free_command(self, slot, target):
+        """
+        Picks a random command that is not used in any other instruction at the moment
+        and is not the same as `slot`'s previous one.
+        If `target`'s grid has no free commands, another grid with free commands is used.
+        If every grid is full, `slot`'s previous command is repeated.
+        :param slot: `Slot` object that will receive the instruction
+        :param target: preferred `Slot` object that will have to execute the instruction
+        :return: (target `Slot`, `GridElement`) tuple
         """
-        Executes a new instruction generation for `slot` after `seconds` have passed
+        command = target.grid.take_free_object()
+        if command is not None:
+            return target, command
+
+        # Target grid is full, try with another one
+        candidates = [x for x in self.slots if x.grid.free_objects]
+        if candidates:
+            target = random.choice(candidates)
+            return target, target.grid.take_free_object()
+
+        # Everything is full, repeat the previous command
+        old_instruction = slot.instruction
+        if old_instruction is not None and old_instruction.target is not None:
+            logging.warning("{} has no free commands, repeating the previous one".format(self.uuid))
+            old_instruction.target.grid.release_object(old_instruction.target_command)
+            command = old_instruction.target.grid.take_free_object()
+            if command is not None:
+                return old_instruction.target, command
+        raise RuntimeError("No free commands")
+
+    async def schedule_generation(self, slot):
+        """
+        Called by `slot`'s generation timer when its instruction expires.
+        Executes a new instruction generation for `slot`
         :param slot: `Slot` object that will receive the `Instruction`
-        :param seconds: number of seconds to wait
         :return:
         """
-        await asyncio.sleep(seconds)
+        if not self.playing:
+            return
 
         # Remove expired instruction
-        if slot.instruction in self.instructions:
-            self.instructions.remove(slot.instruction)
+        self.remove_instruction(slot.instruction)
+        Metrics().instructions.inc("expired")
 
         # Drain health
-        self.health -= self.difficulty["expired_command_health_decrease"]
+        self.health.add(-self.difficulty["expired_command_health_decrease"])
 
         # Generate a new instruction
         await self.generate_instruction(slot, expired=True, stop_old_task=False)  # if True, it would stop itself :|
+        await self.health_changed()
 
-    async def health_drain_loop(self):
-        while True:
-            # Drain health every two seconds second
-            await asyncio.sleep(self.HEALTH_LOOP_RATE)
-            self.health -= self.difficulty["health_drain_rate"] * self.HEALTH_LOOP_RATE
-            self.death_limit = min(
-                90,
-                self.death_limit + self.difficulty["death_limit_increase_rate"] * self.HEALTH_LOOP_RATE
-            )
-            logging.debug("Draining health, new value {} and death limit is {}".format(self.health, self.death_limit))
+    async def health_changed(self):
+        """
+        Called every time an event changes health or its drain.
+        Recomputes when the game will be over and broadcasts the new health model
+        :return:
+        """
+        deadline = self.health.deadline()
+        if deadline is None:
+            if self.game_over_timer is not None:
+                self.game_over_timer.cancel()
+        elif self.game_over_timer is None:
+            self.game_over_timer = Scheduler().call_at(deadline, self.check_game_over)
+        else:
+            Scheduler().reschedule(self.game_over_timer, deadline - Scheduler().time())
+        await self.notify_health()
 
-            if self.health <= self.death_limit:
-                # Game over
-                await self.game_over()
-                break
-            else:
-                # Game still in progress, broadcast new health
-                await self.notify_health()
+    async def check_game_over(self):
+        """
+        Called by the game over timer when health should have reached the death limit
+        :return:
+        """
+        if not self.playing:
+            return
+        health, death_limit = self.health.value(), self.health.death_limit()
+        logging.debug("Health is {} and death limit is {}".format(health, death_limit))
+        if health <= death_limit + 1e-6:
+            await self.game_over()
+        else:
+            # Rounding, try again
+            await self.health_changed()
 
     async def game_over(self):
-        await Sio().emit("game_over", room=self.sio_room)
+        """
+        Ends the game, releasing all timers, rooms and the lobby manager entry
+        :return:
+        """
+        if not self.playing:
+            return
+        self.set_state(game_states.OVER)
+        self.cancel_timers()
+        Metrics().game_overs.inc()
+        await Outbox().emit("game_over", room=self.sio_room)
         logging.info("{} game over".format(self.uuid))
+        await self.dispose()
 
     async def notify_health(self):
-        await Sio().emit("health_info", {
-            "health": self.health,
-            "death_limit": self.death_limit
-        }, room=self.sio_room)
+        await Outbox().emit("health_info", self.health.sio_info(), room=self.sio_room)
 
     async def do_command(self, client, command_name, value=None):
         """
         Called when someone does something on a command on their grid
         :param client: `Client` object, must be in game
-        :param command_name: changed command name, case insensitive
+        :param command_name: changed command name, case insensitive,
+                             or its index in the grid (protocol v2 clients)
         :param value: command value, required only for slider-like, actions and switches commands
         :return:
         """
@@ -622,19 +792,19 @@ class Game:
             raise ValueError("Client not in match")
 
         # Make sure the command is valid
-        command = None
-        for c in slot.grid.objects:
-            if c.name == command_name:
-                command = c
+        if type(command_name) is int:
+            command = slot.grid.get_object_at(command_name)
+        else:
+            command = slot.grid.get_object(command_name)
         if command is None:
             raise ValueError("Command not found")
 
         # Make sure value is valid
         if type(command) is Button and value is not None:
             raise ValueError("Invalid value, must be None")
-        elif issubclass(type(command), SliderLikeElement) and type(value) is not int and (value < command.min or value > command.max):
+        elif issubclass(type(command), SliderLikeElement) and (type(value) is not int or value < command.min or value > command.max):
             raise ValueError("Invalid value, must be an int between min and max")
-        elif type(command) is Actions and type(value) is not str and value.lower() not in command.actions:
+        elif type(command) is Actions and (type(value) is not str or value.lower() not in command.actions):
             raise ValueError("Invalid value, must be a valid action")
         elif type(command) is Switch and type(value) is not bool:
             raise ValueError("Invalid value, must be a bool")
@@ -646,11 +816,7 @@ class Game:
             command.toggled = value
 
         # Check if this command completes an instruction
-        instruction_completed = None
-        for instruction in self.instructions:
-            if issubclass(type(instruction.target_command), GridElement) \
-                    and instruction.target_command.name == command_name and instruction.value == value:
-                instruction_completed = instruction
+        instruction_completed = self.instructions.get((command, value))
 
         if instruction_completed is None:
             # Useless command, apply penality
@@ -660,26 +826,54 @@ class Game:
         # Complete this instruction and generate a new one
         await self.complete_instruction(instruction_completed)
 
+    def add_instruction(self, instruction):
+        """
+        Adds `instruction` to the active instructions indexes
+        :param instruction: `Instruction` object
+        :return:
+        """
+        self.instructions[instruction.key] = instruction
+        if type(instruction.target_command) in self.special_instructions:
+            self.special_instructions[type(instruction.target_command)].add(instruction)
+
+    def remove_instruction(self, instruction):
+        """
+        Removes `instruction` from the active instructions indexes
+        :param instruction: `Instruction` object
+        :return: `True` if the instruction was active, `False` otherwise
+        """
+        if instruction is None or self.instructions.get(instruction.key) is not instruction:
+            return False
+        del self.instructions[instruction.key]
+        if type(instruction.target_command) in self.special_instructions:
+            self.special_instructions[type(instruction.target_command)].discard(instruction)
+        return True
+
     async def complete_instruction(self, instruction_completed, increase_health=True):
         # Remove old instruction
-        self.instructions.remove(instruction_completed)
+        self.remove_instruction(instruction_completed)
+        Metrics().instructions.inc("completed")
 
         # Increase health if needed
         if increase_health:
-            self.health += self.difficulty["completed_instruction_health_increase"]
+            self.health.add(self.difficulty["completed_instruction_health_increase"])
 
         # Broadcast new health or next level
-        if self.health >= 100:
+        if self.health.value() >= 100:
+            Metrics().level_ups.inc()
             await self.next_level()
-            await Sio().emit("next_level", {
+            await Outbox().emit("next_level", {
                 "level": self.level,
                 "modifier": self.game_modifier is not None,
-                "text": self.game_modifier.DESCRIPTION if self.game_modifier is not None else "Nessuna anomalia rilevata"
+                "text": (
+                    self.game_modifier.DESCRIPTION if self.game_modifier is not None
+                    else catalog(self.locale).no_modifier
+                )
             }, room=self.sio_room)
         else:
             # This was an useful command! Force new generation outside the loop
             await self.generate_instruction(instruction_completed.source, expired=False, stop_old_task=True)
-            await self.notify_health()
+            await self.health_changed()
 
     async def dispose(self):
         """
@@ -687,31 +881,21 @@ class Game:
         :return:
         """
         # Make sure the match is not already disposing
-        if self.disposing:
+        if self.state == game_states.DISPOSED:
             raise RuntimeError("The match is already disposing")
-        self.disposing = True
-
-        # Cancel all pending next generation tasks
-        for slot in self.slots:
-            if slot.next_generation_task is not None:
-                logging.debug("slot {} generation task cancelled".format(slot))
-                slot.next_generation_task.cancel()
-
-        # Cancel health drain task too
-        if self.health_drain_task is not None:
-            logging.debug("Health drain task cancelled")
-            self.health_drain_task.cancel()
+        was_in_lobby = self.state == game_states.LOBBY
+        self.set_state(game_states.DISPOSED)
 
-        # Also game modifier task
-        if self.game_modifier_task is not None:
-            logging.debug("Game modifier task cancelled")
-            self.game_modifier_task.cancel()
+        # Cancel all pending timers
+        self.cancel_timers()
 
         # Make everyone leave the game
-        for slot in self.slots:
+        for slot in list(self.slots):
             await slot.client.leave_game()
 
         # Remove from lobby
+        if was_in_lobby:
+            await self.notify_lobby_dispose()
         await LobbyManager().remove_game(self)
 
         logging.info("{} match disposed".format(self.uuid))
@@ -724,37 +908,48 @@ class Game:
         if slot is None:
             raise ValueError("Client not in match")
 
-        # Defeat thing
-        if black_hole:
-            slot.defeating_black_hole = True
-        else:
-            slot.defeating_asteroid = True
+        # Presses inside an open window don't move it
+        now = Scheduler().time()
+        previous_until = slot.defeating_until(black_hole)
+        if previous_until <= now:
+            if previous_until > 0:
+                # The window is over but its timer hasn't fired yet
+                self.close_defeat_window(slot, black_hole, previous_until)
+
+            # Open the defeat window and close it after `DEFEAT_WINDOW` seconds
+            until = now + self.DEFEAT_WINDOW
+            slot.set_defeating_until(black_hole, until)
+            self.defeating_slots[black_hole] += 1
+            if slot.defeat_window_timers[black_hole] is not None:
+                slot.defeat_window_timers[black_hole].cancel()
+            slot.defeat_window_timers[black_hole] = Scheduler().call_at(
+                until, self.close_defeat_window, slot, black_hole, until
+            )
 
-        # Check if everyone is defeating
-        all_defeated = True
-        for s in self.slots:
-            if (not s.defeating_black_hole and black_hole) or (not s.defeating_asteroid and not black_hole):
-                all_defeated = False
-                break
+        # Check if there's a special command (we may have more than once).
+        # Checked on every press, the instruction may have been generated after all the windows were opened.
+        special_instructions = self.special_instructions[DummyBlackHoleCommand if black_hole else DummyAsteroidCommand]
 
         # Everyone has defeated asteroid/black hole!
-        if all_defeated:
+        if special_instructions and self.defeating_slots[black_hole] >= len(self.slots):
             logging.debug("All defeated!")
+            instructions_completed = list(special_instructions)
 
-            # Check if there's a special command (we may have more than once)
-            instructions_completed = []
-            for instruction in self.instructions:
-                if (type(instruction.target_command) is DummyBlackHoleCommand and black_hole) \
-                        or (type(instruction.target_command) is DummyAsteroidCommand and not black_hole):
-                    instructions_completed.append(instruction)
-
-            # Complete all instructions (two loops because we're removing items from self.instructions)
+            # Complete all instructions (copied because we're removing items from the index)
             for instruction in instructions_completed:
                 logging.debug("SPECIAL DONE!")
                 await self.complete_instruction(instruction, increase_health=False)
 
-        # Reset defeating back to False after two seconds
-        asyncio.Task(slot.reset_black_hole() if black_hole else slot.reset_asteroid())
-
-
-
+    def close_defeat_window(self, slot, black_hole, until):
+        """
+        Called by the scheduler when `slot`'s asteroid/black hole defeat window expires
+        :param slot: `Slot` object
+        :param black_hole: `True` for the black hole window, `False` for the asteroid one
+        :param until: expiration time of the window to close
+        :return:
+        """
+        if slot.defeating_until(black_hole) != until:
+            # Already closed
+            return
+        slot.set_defeating_until(black_hole, 0)
+        self.defeating_slots[black_hole] -= 1
@@ -1,19 +1,43 @@
-import asyncio
 import logging
 import random
 import string
 
-from singletons.sio import Sio
+from singletons.outbox import Outbox
+from singletons.scheduler import Scheduler
 
 
 class GameModifier:
     DESCRIPTION = ""
+    TICK_RATE = None    # seconds between `tick()` calls. `None` if the modifier doesn't need a periodic task
 
     def __init__(self, match):
         self.match = match
-
-    async def task(self):
-        raise asyncio.CancelledError()
+        self.timer = None
+
+    def start(self):
+        """
+        Starts calling `tick()` every `TICK_RATE` seconds on the shared scheduler
+        :return:
+        """
+        if self.TICK_RATE is None:
+            return
+        if self.timer is None:
+            self.timer = Scheduler().call_later(self.TICK_RATE, self._tick)
+        else:
+            Scheduler().reschedule(self.timer, self.TICK_RATE)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+
+    async def _tick(self):
+        if not self.match.playing:
+            return
+        Scheduler().reschedule(self.timer, self.TICK_RATE)
+        await self.tick()
+
+    async def tick(self):
+        return
 
     def grid_post_processor(self, grid):
         return
@@ -24,13 +48,12 @@ class GameModifier:
 
 class FlipGrid(GameModifier):
     DESCRIPTION = "Matrice di riflessione attivata"
+    TICK_RATE = 8
 
-    async def task(self):
-        while True:
-            logging.debug("Screen filp")
-            if random.getrandbits(1):
-                await Sio().emit("flip_grid", room=self.match.sio_room)
-            await asyncio.sleep(8)
+    async def tick(self):
+        logging.debug("Screen filp")
+        if random.getrandbits(1):
+            await Outbox().emit("flip_grid", room=self.match.sio_room)
 
 
 class Symbols(GameModifier):
@@ -46,7 +69,7 @@ class Symbols(GameModifier):
                 if random.randrange(0, 2) == 0:
                     total_symbols += 1
                     o.additional_data["symbol"] = True
-                    o.name = random.choice(available_symbols)
+                    grid.rename_object(o, random.choice(available_symbols))
                     available_symbols.remove(o.name)
 
 
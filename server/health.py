@@ -0,0 +1,124 @@
+import time
+
+from singletons.scheduler import Scheduler
+
+
+class Health:
+    """
+    Piecewise-linear model of a game's health and death limit.
+    Both values are computed lazily from the reference time, so no periodic
+    task is needed to drain health. The model is rebased (current values become the new
+    offsets) every time an event changes the offset or the slopes.
+    """
+    MAX_DEATH_LIMIT = 90
+
+    def __init__(self, health, death_limit=0):
+        self._health = health
+        self._death_limit = death_limit
+        self.drain_rate = 0
+        self.death_limit_rate = 0
+        self.reference_time = Scheduler().time()
+
+    def reset(self, health, death_limit=0):
+        """
+        Sets health and death limit and stops draining
+        :param health: new health value
+        :param death_limit: new death limit value
+        :return:
+        """
+        self._health = health
+        self._death_limit = death_limit
+        self.drain_rate = 0
+        self.death_limit_rate = 0
+        self.reference_time = Scheduler().time()
+
+    def start(self, drain_rate, death_limit_rate):
+        """
+        Starts draining health and increasing the death limit from now on
+        :param drain_rate: health drain per second
+        :param death_limit_rate: death limit increase per second
+        :return:
+        """
+        self.rebase()
+        self.drain_rate = drain_rate
+        self.death_limit_rate = death_limit_rate
+
+    def add(self, amount):
+        """
+        Adds `amount` (can be negative) to the current health
+        :param amount: health delta
+        :return:
+        """
+        self.rebase()
+        self._health += amount
+
+    def rebase(self, now=None):
+        """
+        Moves the reference time to `now`, folding the elapsed drain into the offsets
+        :param now: loop time. If `None`, use the current one.
+        :return:
+        """
+        if now is None:
+            now = Scheduler().time()
+        self._health = self.value(now)
+        self._death_limit = self.death_limit(now)
+        self.reference_time = now
+
+    def value(self, now=None):
+        """
+        :param now: loop time. If `None`, use the current one.
+        :return: health at `now`
+        """
+        if now is None:
+            now = Scheduler().time()
+        return self._health - self.drain_rate * (now - self.reference_time)
+
+    def death_limit(self, now=None):
+        """
+        :param now: loop time. If `None`, use the current one.
+        :return: death limit at `now`
+        """
+        if now is None:
+            now = Scheduler().time()
+        if self._death_limit >= self.MAX_DEATH_LIMIT:
+            return self._death_limit
+        return min(
+            self.MAX_DEATH_LIMIT,
+            self._death_limit + self.death_limit_rate * (now - self.reference_time)
+        )
+
+    def deadline(self):
+        """
+        Computes the loop time when health will reach the death limit,
+        assuming no other event changes the model before then.
+        :return: loop time, or `None` if health never reaches the death limit
+        """
+        h, l, d, r = self._health, self._death_limit, self.drain_rate, self.death_limit_rate
+        if h <= l:
+            return self.reference_time
+        if r > 0 and l < self.MAX_DEATH_LIMIT:
+            # Both lines move until the death limit reaches its cap
+            cap_time = (self.MAX_DEATH_LIMIT - l) / r
+            cross_time = (h - l) / (d + r)
+            if cross_time <= cap_time:
+                return self.reference_time + cross_time
+            l = self.MAX_DEATH_LIMIT
+        if d <= 0:
+            return None
+        return self.reference_time + (h - l) / d
+
+    def sio_info(self):
+        """
+        Health info sent to clients. `timestamp` is the unix time `health` and `death_limit`
+        refer to, so the clients can extrapolate them with the two rates until the next event.
+        :return:
+        """
+        now = Scheduler().time()
+        return {
+            "health": self.value(now),
+            "death_limit": self.death_limit(now),
+            "health_drain_rate": self.drain_rate,
+            "death_limit_increase_rate": self.death_limit_rate,
+            "max_death_limit": self.MAX_DEATH_LIMIT,
+            "timestamp": time.time()
+        }
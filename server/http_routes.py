@@ -0,0 +1,47 @@
+from aiohttp import web
+
+from singletons.lobby_manager import LobbyManager
+from singletons.metrics import Metrics
+
+
+async def lobby(request):
+    """
+    GET /lobby
+    Returns the lobby snapshot (same as the `lobby_snapshot` event).
+    Supports `If-None-Match`, so lobby pages can poll it cheaply.
+    """
+    etag, body = LobbyManager().snapshot_body()
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Expose-Headers": "ETag"
+    }
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type="application/json", headers=headers)
+
+
+async def metrics(request):
+    """
+    GET /metrics
+    Returns the process metrics in the Prometheus text format
+    """
+    # aiohttp doesn't accept parameters other than charset in `content_type`, set the header directly
+    return web.Response(
+        text=Metrics().render(),
+        headers={
+            "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+            "Cache-Control": "no-cache"
+        }
+    )
+
+
+def setup(app):
+    """
+    Registers the HTTP routes on an aiohttp application
+    :param app: `aiohttp.web.Application` object
+    :return:
+    """
+    app.router.add_get("/lobby", lobby)
+    app.router.add_get("/metrics", metrics)
@@ -1,87 +1,43 @@
-import logging
 import random
 
-from utils.grid import Button, SliderLikeElement, Switch, Actions, GridElement
-from utils.special_commands import DummyBlackHoleCommand, DummyAsteroidCommand, SpecialCommand
+from server.instruction_templates import catalog
+from utils.grid import SliderLikeElement, Switch, Actions
 
 
 class Instruction:
-    def __init__(self, source, target, target_command):
+    def __init__(self, source, target, target_command, locale=None):
         self.source = source
         self.target = target
         self.target_command = target_command
+        self.templates = catalog(locale)
         self.value = self.generate_value()  # new value to set the target command to. Only for sliders/switches
         self.text = self.generate_text()    # instruction text, visible to the client
 
+    @property
+    def key(self):
+        """
+        Key of this instruction in the game's active instructions index.
+        It's the command that completes the instruction and the value it must be set to.
+        :return:
+        """
+        return self.target_command, self.value
+
     def generate_value(self):
-        if type(self.target_command) is Button:
-            # No extra actions required for buttons
-            return None
-        elif issubclass(type(self.target_command), SpecialCommand):
-            # Same for asteroids and black holes
-            return None
-        elif issubclass(type(self.target_command), SliderLikeElement):
+        if issubclass(type(self.target_command), SliderLikeElement):
             # For slider-like elements, pick a new random value between min and max, excluding the current one
-            return random.choice([x for x in range(self.target_command.min, self.target_command.max + 1) if x != self.target_command.value])
+            value = random.randint(self.target_command.min, self.target_command.max - 1)
+            return value + 1 if value >= self.target_command.value else value
         elif type(self.target_command) is Switch:
             # If it's a switch, flip it
             return not self.target_command.toggled
         elif type(self.target_command) is Actions:
             return random.choice(self.target_command.actions)
-
-    def generate_text(self):
-        if type(self.target_command) is Button:
-            sentences = [
-                "Azionare {name}",
-                "Innestare {name}",
-                "Premere {name}"
-            ]
-        elif issubclass(type(self.target_command), SliderLikeElement):
-            sentences = [
-                "Impostare {name} a {value}",
-                "Cambiare {name} a {value}",
-                "Posizionare {name} su {value}",
-            ]
-            if self.value > self.target_command.value:
-                sentences.append("Aumentare {name} a {value}")
-            else:
-                sentences += ["Diminuire {name} a {value}", "Ridurre {name} a {value}"]
-
-            if self.value == self.target_command.max:
-                sentences += ["Aumentare {name} al massimo", "Impostare {name} al massimo"]
-            elif self.value == self.target_command.min:
-                sentences += ["Diminuire {name} al minimo", "Impostare {name} al minimo"]
-        elif type(self.target_command) is Actions:
-            sentences = ["{value} {name}"]
-        elif type(self.target_command) is Switch:
-            # Switch
-            if self.value:
-                sentences = [
-                    "Attivare {name}",
-                    "Innestare {name}",
-                    "Accendere {name}",
-                ]
-            else:
-                sentences = [
-                    "Disattivare {name}",
-                    "Disinnestare {name}",
-                    "Spegnere {name}",
-                ]
-        elif type(self.target_command) is DummyAsteroidCommand:
-            sentences = ["Asteroide! (scuotere tutti il mouse)"]
-        elif type(self.target_command) is DummyBlackHoleCommand:
-            sentences = ["Buco nero! (premere tutti invio più volte)"]
         else:
-            raise ValueError("Invalid command type")
+            # No extra actions required for buttons, asteroids and black holes
+            return None
 
+    def generate_text(self):
         # Choose a random sentence form the possible ones and format it
-        sentence = random.choice(sentences)
-        if issubclass(type(self.target_command), GridElement):
-            if "symbol" in self.target_command.additional_data:
-                name = "${}".format(self.target_command.name)
-            else:
-                name = self.target_command.name
-        else:
-            name = ""
-        s = sentence.format(name=name, value=self.value.capitalize() if type(self.value) is str else self.value)
-        return s
+        sentence = random.choice(self.templates.templates(self.target_command, self.value))
+        name = self.target.grid.display_name(self.target_command) if self.target is not None else ""
+        return sentence.render(name, self.value.capitalize() if type(self.value) is str else self.value)
@@ -0,0 +1,141 @@
+import operator
+import string
+
+from singletons.config import Config
+from utils.grid import Button, Slider, CircularSlider, ButtonsSlider, Switch, Actions
+from utils.special_commands import DummyAsteroidCommand, DummyBlackHoleCommand
+
+# Instruction sentences for every language. `{name}` is the command name, `{value}` the new value.
+# Slider sentences are picked from "any", plus "increase" or "decrease" (according to the new value),
+# plus "max" or "min" if the new value is the maximum or the minimum one.
+SENTENCES = {
+    "it": {
+        "button": [
+            "Azionare {name}",
+            "Innestare {name}",
+            "Premere {name}"
+        ],
+        "slider": {
+            "any": [
+                "Impostare {name} a {value}",
+                "Cambiare {name} a {value}",
+                "Posizionare {name} su {value}",
+            ],
+            "increase": ["Aumentare {name} a {value}"],
+            "decrease": ["Diminuire {name} a {value}", "Ridurre {name} a {value}"],
+            "max": ["Aumentare {name} al massimo", "Impostare {name} al massimo"],
+            "min": ["Diminuire {name} al minimo", "Impostare {name} al minimo"],
+        },
+        "actions": ["{value} {name}"],
+        "switch_on": [
+            "Attivare {name}",
+            "Innestare {name}",
+            "Accendere {name}",
+        ],
+        "switch_off": [
+            "Disattivare {name}",
+            "Disinnestare {name}",
+            "Spegnere {name}",
+        ],
+        "asteroid": ["Asteroide! (scuotere tutti il mouse)"],
+        "black_hole": ["Buco nero! (premere tutti invio più volte)"],
+        "warmup": "Prepararsi a ricevere istruzioni",
+        "no_modifier": "Nessuna anomalia rilevata"
+    }
+}
+
+
+class Template:
+    """
+    A sentence split once into literal parts and `name`/`value` placeholders,
+    rendered with a single `%` operation
+    """
+    __slots__ = ("pattern", "getter")
+
+    def __init__(self, sentence):
+        pattern = []
+        fields = []
+        for literal, field, _, _ in string.Formatter().parse(sentence):
+            pattern.append(literal.replace("%", "%%"))
+            if field is not None:
+                if field not in ("name", "value"):
+                    raise ValueError("Invalid placeholder {} in {}".format(field, sentence))
+                pattern.append("%s")
+                fields.append(0 if field == "name" else 1)
+        self.pattern = "".join(pattern)
+        self.getter = operator.itemgetter(*fields) if fields else None
+
+    def render(self, name, value):
+        if self.getter is None:
+            return self.pattern % ()
+        return self.pattern % self.getter((name, value))
+
+
+class TemplateCatalog:
+    """
+    The instruction sentences of a language, compiled once per element type
+    """
+    def __init__(self, sentences):
+        def compile_all(x):
+            return tuple(Template(s) for s in x)
+
+        slider = sentences["slider"]
+        self.sliders = {}
+        for increase in (True, False):
+            for extreme in ("max", "min", None):
+                self.sliders[(increase, extreme)] = compile_all(
+                    slider["any"]
+                    + slider["increase" if increase else "decrease"]
+                    + (slider[extreme] if extreme is not None else [])
+                )
+
+        self.by_type = {
+            Button: compile_all(sentences["button"]),
+            Actions: compile_all(sentences["actions"]),
+            DummyAsteroidCommand: compile_all(sentences["asteroid"]),
+            DummyBlackHoleCommand: compile_all(sentences["black_hole"]),
+        }
+        self.switch = {
+            True: compile_all(sentences["switch_on"]),
+            False: compile_all(sentences["switch_off"])
+        }
+        self.warmup = sentences["warmup"]
+        self.no_modifier = sentences["no_modifier"]
+
+    def templates(self, command, value):
+        """
+        :param command: `GridElement` or `SpecialCommand` object
+        :param value: value the command must be set to
+        :return: tuple of the `Template`s that can be used for this instruction
+        """
+        command_type = type(command)
+        if command_type in (Slider, CircularSlider, ButtonsSlider):
+            if value == command.max:
+                extreme = "max"
+            elif value == command.min:
+                extreme = "min"
+            else:
+                extreme = None
+            return self.sliders[(value > command.value, extreme)]
+        elif command_type is Switch:
+            return self.switch[value]
+        elif command_type in self.by_type:
+            return self.by_type[command_type]
+        raise ValueError("Invalid command type")
+
+
+_catalogs = {}
+
+
+def catalog(locale=None):
+    """
+    Returns the compiled sentences of a language, compiling them the first time.
+    Unknown languages fall back to the default one.
+    :param locale: language. If `None`, use the default one.
+    :return: `TemplateCatalog` object
+    """
+    result = _catalogs.get(locale)
+    if result is None:
+        sentences = SENTENCES.get(locale, SENTENCES.get(Config()["WORDS_LOCALE"], SENTENCES["it"]))
+        result = _catalogs[locale] = TemplateCatalog(sentences)
+    return result
@@ -0,0 +1,99 @@
+import collections
+import logging
+
+from singletons.client_manager import ClientManager
+from singletons.config import Config
+from singletons.lobby_manager import LobbyManager
+from singletons.loop_monitor import LoopMonitor
+from utils.singleton import singleton
+
+# Admission kinds
+CONNECTION = "connection"
+NEW_GAME = "new_game"
+GAME_START = "game_start"
+
+# Refusal reasons
+LAG = "lag"
+CONNECTIONS = "connections"
+GAMES = "games"
+GAMES_IN_PROGRESS = "games_in_progress"
+
+
+@singleton
+class Admission:
+    """
+    Process-wide admission control.
+    New connections, new games and game starts are refused when the process has reached its static caps
+    (`MAX_CONNECTIONS`, `MAX_GAMES`, `MAX_GAMES_IN_PROGRESS`, 0 means no cap) or when the event loop
+    is saturated, so the games that are already in progress keep firing their timers on time.
+    The process is saturated when the event loop lag goes over `MAX_LOOP_LAG` seconds,
+    and stops being saturated when it goes back under half of it.
+    """
+    def __init__(self):
+        self._saturated = False
+        self.refused = collections.Counter()    # (kind, reason) -> refused requests
+
+    @property
+    def saturated(self):
+        """
+        :return: `True` if the event loop lag is too high to admit new load
+        """
+        max_lag = Config()["MAX_LOOP_LAG"]
+        if max_lag <= 0:
+            return False
+        lag = LoopMonitor().lag
+        if not self._saturated and lag > max_lag:
+            logging.warning("Event loop lag is {:.3f}s, refusing new games and connections".format(lag))
+            self._saturated = True
+        elif self._saturated and lag < max_lag / 2:
+            logging.info("Event loop lag is {:.3f}s, admitting new games and connections again".format(lag))
+            self._saturated = False
+        return self._saturated
+
+    @staticmethod
+    def games_in_progress():
+        return LobbyManager().games_in_progress
+
+    def _refuse(self, kind, reason):
+        self.refused[(kind, reason)] += 1
+        return reason
+
+    def check_connection(self):
+        """
+        :return: `None` if a new client can connect, otherwise the refusal reason
+        """
+        cap = Config()["MAX_CONNECTIONS"]
+        if cap > 0 and len(ClientManager()) >= cap:
+            return self._refuse(CONNECTION, CONNECTIONS)
+        if self.saturated:
+            return self._refuse(CONNECTION, LAG)
+        return None
+
+    def check_new_game(self):
+        """
+        :return: `None` if a new game can be created, otherwise the refusal reason
+        """
+        cap = Config()["MAX_GAMES"]
+        if cap > 0 and len(LobbyManager()) >= cap:
+            return self._refuse(NEW_GAME, GAMES)
+        if self.saturated:
+            return self._refuse(NEW_GAME, LAG)
+        return None
+
+    def check_game_start(self):
+        """
+        :return: `None` if a game can start, otherwise the refusal reason
+        """
+        cap = Config()["MAX_GAMES_IN_PROGRESS"]
+        if cap > 0 and self.games_in_progress() >= cap:
+            return self._refuse(GAME_START, GAMES_IN_PROGRESS)
+        if self.saturated:
+            return self._refuse(GAME_START, LAG)
+        return None
+
+    def stats(self):
+        return {
+            "saturated": self._saturated,
+            "loop_lag": LoopMonitor().lag,
+            "refused": {"{}_{}".format(*k): v for k, v in self.refused.items()}
+        }
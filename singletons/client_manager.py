@@ -25,6 +25,9 @@ class ClientManager:
     def __getitem__(self, item):
         return self._clients_by_sid[item]
 
+    def __len__(self):
+        return len(self._clients_by_sid)
+
     def next_uid(self):
         self._uid += 1
         return self._uid
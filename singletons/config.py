@@ -15,6 +15,37 @@ class Config:
 
             "SSL_CERT": config("SSL_CERT", default="cert.crt"),
             "SSL_KEY": config("SSL_KEY", default="key.key"),
+
+            # "json", "orjson", "rapidjson", "ujson" or "auto" (fastest installed one)
+            "JSON_BACKEND": config("JSON_BACKEND", default="auto"),
+
+            "GRID_POOL_SIZE": config("GRID_POOL_SIZE", default="8", cast=int),
+            "WORDS_LOCALE": config("WORDS_LOCALE", default="it"),
+            "LOBBY_FLUSH_INTERVAL": config("LOBBY_FLUSH_INTERVAL", default="0.2", cast=float),
+
+            # A client is slow if its held outbound events are bigger/older than this
+            "SLOW_CLIENT_BYTES": config("SLOW_CLIENT_BYTES", default="65536", cast=int),
+            "SLOW_CLIENT_AGE": config("SLOW_CLIENT_AGE", default="5", cast=float),
+            # Slow clients are disconnected if they don't catch up in this many seconds
+            "SLOW_CLIENT_TIMEOUT": config("SLOW_CLIENT_TIMEOUT", default="15", cast=float),
+
+            # Admission control. New connections, games and game starts are refused over these caps (0 means no cap)
+            # or while the event loop lag is over `MAX_LOOP_LAG` seconds (0 disables the lag check).
+            "MAX_CONNECTIONS": config("MAX_CONNECTIONS", default="2000", cast=int),
+            "MAX_GAMES": config("MAX_GAMES", default="500", cast=int),
+            "MAX_GAMES_IN_PROGRESS": config("MAX_GAMES_IN_PROGRESS", default="250", cast=int),
+            "MAX_LOOP_LAG": config("MAX_LOOP_LAG", default="0.1", cast=float),
+
+            # Log the stack of callbacks that block the event loop for longer than this many seconds (0 disables it)
+            "SLOW_CALLBACK_THRESHOLD": config("SLOW_CALLBACK_THRESHOLD", default="0.1", cast=float),
+
+            # Per client rate limits of gameplay events, in events per second and burst size. 0 disables the limit.
+            "COMMAND_RATE_LIMIT": config("COMMAND_RATE_LIMIT", default="20", cast=float),
+            "COMMAND_RATE_BURST": config("COMMAND_RATE_BURST", default="40", cast=int),
+            "DEFEAT_RATE_LIMIT": config("DEFEAT_RATE_LIMIT", default="30", cast=float),
+            "DEFEAT_RATE_BURST": config("DEFEAT_RATE_BURST", default="60", cast=int),
+            "READY_RATE_LIMIT": config("READY_RATE_LIMIT", default="2", cast=float),
+            "READY_RATE_BURST": config("READY_RATE_BURST", default="6", cast=int),
         }
 
         if not self._config["DEBUG"]:
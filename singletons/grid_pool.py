@@ -0,0 +1,94 @@
+import asyncio
+import collections
+import logging
+
+from singletons.config import Config
+from singletons.words_storage import WordsStorage
+from utils.command_name_generator import CommandNameGenerator
+from utils.grid import Grid
+from utils.singleton import singleton
+
+
+@singleton
+class GridPool:
+    """
+    Bounded pool of pre-generated grid sets, one queue per words locale and number of players.
+    Grid sets are generated one per event loop iteration in the background,
+    so level transitions just pop a ready set instead of generating grids
+    synchronously while every other game waits.
+    """
+    def __init__(self):
+        self.size = Config()["GRID_POOL_SIZE"]
+        self._pools = collections.defaultdict(collections.deque)
+        self._refill_handle = None
+
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+
+    @staticmethod
+    def generate(players, locale):
+        """
+        Generates a new grid set. All grids share the same name generator, so names are unique in the set.
+        :param players: number of grids
+        :param locale: words locale
+        :return: list of `Grid` objects
+        """
+        name_generator = CommandNameGenerator(WordsStorage().pack(locale))
+        return [Grid(name_generator) for _ in range(players)]
+
+    def get(self, players, locale=None):
+        """
+        Returns a grid set for `players` players, generating it on the spot if the pool is empty
+        :param players: number of grids
+        :param locale: words locale. If `None`, use the default one.
+        :return: list of `Grid` objects
+        """
+        if locale is None:
+            locale = WordsStorage().default_locale
+        pool = self._pools[(locale, players)]
+        if pool:
+            self.hits += 1
+            grids = pool.popleft()
+        else:
+            self.misses += 1
+            logging.debug("Grid pool miss for {} players ({})".format(players, locale))
+            grids = self.generate(players, locale)
+        self.schedule_refill()
+        return grids
+
+    def prefill(self, players_range, locale=None):
+        """
+        Registers the pools for `players_range` and starts filling them in the background
+        :param players_range: iterable of numbers of players
+        :param locale: words locale. If `None`, use the default one.
+        :return:
+        """
+        if locale is None:
+            locale = WordsStorage().default_locale
+        for players in players_range:
+            _ = self._pools[(locale, players)]
+        self.schedule_refill()
+
+    def schedule_refill(self):
+        if self._refill_handle is None and self.size > 0:
+            self._refill_handle = asyncio.get_event_loop().call_soon(self._refill_step)
+
+    def _refill_step(self):
+        self._refill_handle = None
+
+        # Refill the emptiest pool with one grid set, then yield to the event loop
+        (locale, players), pool = min(self._pools.items(), key=lambda x: len(x[1]))
+        if len(pool) >= self.size:
+            return
+        pool.append(self.generate(players, locale))
+        self.refills += 1
+        self.schedule_refill()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refills": self.refills,
+            "sizes": {"{}/{}".format(*k): len(v) for k, v in self._pools.items()}
+        }
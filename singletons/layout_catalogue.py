@@ -0,0 +1,159 @@
+import bisect
+import logging
+import random
+from array import array
+
+from constants import layout_cells
+from utils.singleton import singleton
+
+# Every (cell type, length) combination a layout can contain. A placement is stored in a single byte:
+# the cell index (y * 4 + x) in the upper bits and the index in this list in the lower 3 bits.
+SHAPES = [
+    (layout_cells.SQUARE, 1),
+    (layout_cells.VERTICAL_RECTANGLE, 2),
+    (layout_cells.VERTICAL_RECTANGLE, 3),
+    (layout_cells.HORIZONTAL_RECTANGLE, 2),
+    (layout_cells.HORIZONTAL_RECTANGLE, 3),
+    (layout_cells.BIG_SQUARE, 2),
+]
+SHAPE_BITS = 3
+SIZE = 4
+
+
+def shape_mask(y, x, _type, length):
+    """
+    :return: bitboard of the cells covered by a shape placed at y, x
+    """
+    if _type == layout_cells.VERTICAL_RECTANGLE:
+        cells = [(y + i, x) for i in range(length)]
+    elif _type == layout_cells.HORIZONTAL_RECTANGLE:
+        cells = [(y, x + i) for i in range(length)]
+    elif _type == layout_cells.BIG_SQUARE:
+        cells = [(y + i, x + j) for i in range(length) for j in range(length)]
+    else:
+        cells = [(y, x)]
+    mask = 0
+    for cy, cx in cells:
+        mask |= 1 << (cy * SIZE + cx)
+    return mask
+
+
+def placement_options(mask):
+    """
+    Returns all the shapes that can be placed in the first empty cell of a layout,
+    with the same probabilities the old cell by cell generator used.
+    :param mask: bitboard of the occupied cells
+    :return: list of (probability, encoded placement, new mask) tuples,
+             or `None` if the layout is complete
+    """
+    full = (1 << SIZE * SIZE) - 1
+    if mask == full:
+        return None
+
+    # Next empty cell, left to right, top to bottom
+    i = 0
+    while mask >> i & 1:
+        i += 1
+    y, x = divmod(i, SIZE)
+
+    # Free space to the right
+    fsr = 0
+    while x + fsr < SIZE and not mask >> (y * SIZE + x + fsr) & 1:
+        fsr += 1
+
+    if fsr == 1:
+        # No space left on x axis, only Squares and VerticalRectangles allowed
+        pool = [layout_cells.SQUARE, layout_cells.VERTICAL_RECTANGLE]
+    else:
+        # More space, everything can fit
+        pool = [
+            layout_cells.SQUARE, layout_cells.VERTICAL_RECTANGLE,
+            layout_cells.HORIZONTAL_RECTANGLE, layout_cells.BIG_SQUARE
+        ]
+    if y == SIZE - 1:
+        # No space left on y axis, remove VerticalRectangles and BigSquares from pool
+        pool = [z for z in pool if z not in (layout_cells.VERTICAL_RECTANGLE, layout_cells.BIG_SQUARE)]
+
+    options = []
+    for _type in pool:
+        if _type == layout_cells.HORIZONTAL_RECTANGLE:
+            lengths = [2, 3] if fsr > 2 else [2]
+        elif _type == layout_cells.VERTICAL_RECTANGLE:
+            lengths = [2, 3] if y <= 1 else [2]
+        elif _type == layout_cells.BIG_SQUARE:
+            lengths = [2]
+        else:
+            lengths = [1]
+        for length in lengths:
+            options.append((
+                1 / len(pool) / len(lengths),
+                i << SHAPE_BITS | SHAPES.index((_type, length)),
+                mask | shape_mask(y, x, _type, length)
+            ))
+    return options
+
+
+@singleton
+class LayoutCatalogue:
+    """
+    All the possible 4x4 grid layouts, enumerated once at startup.
+    Layouts are stored as byte strings of encoded placements in a single buffer
+    and sampled with their cumulative probabilities, reproducing the same
+    shape distribution of the old cell by cell generator.
+    """
+    def __init__(self):
+        self._data = b""
+        self._offsets = array("I", [0])
+        self._cumulative_weights = array("d")
+
+    def __len__(self):
+        return len(self._cumulative_weights)
+
+    def load(self):
+        data = bytearray()
+        offsets = array("I", [0])
+        cumulative_weights = array("d")
+        total = 0.0
+
+        # Depth first visit of all placement sequences
+        stack = [(0, b"", 1.0)]
+        while stack:
+            mask, layout, probability = stack.pop()
+            options = placement_options(mask)
+            if options is None:
+                data += layout
+                offsets.append(len(data))
+                total += probability
+                cumulative_weights.append(total)
+                continue
+            for option_probability, placement, new_mask in options:
+                stack.append((new_mask, layout + bytes((placement,)), probability * option_probability))
+
+        self._data = bytes(data)
+        self._offsets = offsets
+        self._cumulative_weights = cumulative_weights
+        logging.info("Loaded {} grid layouts".format(len(self)))
+
+    def layout(self, i):
+        """
+        Decodes a layout
+        :param i: layout index
+        :return: list of (y, x, cell type, length) placements, in placement order
+        """
+        result = []
+        for placement in self._data[self._offsets[i]:self._offsets[i + 1]]:
+            y, x = divmod(placement >> SHAPE_BITS, SIZE)
+            _type, length = SHAPES[placement & ((1 << SHAPE_BITS) - 1)]
+            result.append((y, x, _type, length))
+        return result
+
+    def sample(self):
+        """
+        Picks a random layout, weighted by its probability
+        :return: list of (y, x, cell type, length) placements, in placement order
+        """
+        if not self._cumulative_weights:
+            self.load()
+        r = random.random() * self._cumulative_weights[-1]
+        i = min(bisect.bisect(self._cumulative_weights, r), len(self) - 1)
+        return self.layout(i)
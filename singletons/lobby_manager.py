@@ -1,16 +1,59 @@
+import bisect
+import heapq
+import itertools
 import logging
 import uuid
+from collections import defaultdict
 
 import server.game
+from constants import game_states
+from singletons.config import Config
+from singletons.scheduler import Scheduler
 from singletons.sio import Sio
+from utils.json_serializer import PreEncoded
 from utils.singleton import singleton
 
 
 @singleton
 class LobbyManager:
+    """
+    Registry of all the games.
+    Lobby updates are coalesced: games that changed are marked as dirty and
+    flushed to the lobby room every `LOBBY_FLUSH_INTERVAL` seconds as a single
+    `lobby_update` event, together with the games that disappeared from the lobby.
+    It also keeps a versioned snapshot of the public lobby, encoded only when the lobby changes.
+
+    Games listed in the lobby (public and not started) are indexed by creation order
+    (a sequence number), by number of free slots and by lowercase name,
+    so listings and queries never scan private or in progress games.
+    """
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+
     def __init__(self):
         self._games_by_uuid = {}
 
+        self._next_sequence = 0
+        self._sequences = {}                    # uuid -> sequence number
+        self._games_by_sequence = {}            # sequence number -> game, all games
+        self._listed = {}                       # sequence number -> free slots, listed games only
+        self._free_buckets = defaultdict(list)  # free slots -> sorted sequence numbers
+        self._names = []                        # sorted (lowercase name, sequence number) tuples
+        self._dirty_games = {}
+        self._disposed_games = {}
+        self._flush_timer = None
+
+        # Games in the intro or playing state, kept up to date by `Game.set_state`
+        self.games_in_progress = 0
+
+        # The version is bumped every time a game is added to, changed in or removed from the lobby.
+        # The epoch makes ETags from different processes different.
+        self.version = 0
+        self._epoch = uuid.uuid4().hex[:8]
+        self._snapshot = None
+        self._snapshot_body = None
+        self._snapshot_version = None
+
     async def add_game(self, game):
         """
         Adds a game to registered games
@@ -23,6 +66,9 @@ class LobbyManager:
         # Generate UUID and register game
         game.uuid = self.generate_uuid()
         self._games_by_uuid[game.uuid] = game
+        self._sequences[game.uuid] = self._next_sequence
+        self._games_by_sequence[self._next_sequence] = game
+        self._next_sequence += 1
 
         # Notify lobby
         await game.notify_lobby()
@@ -31,7 +77,8 @@ class LobbyManager:
 
     async def remove_game(self, game):
         """
-        Removes a previously registered game
+        Removes a previously registered game.
+        The game is responsible for notifying the lobby
         :param game:
         :return:
         """
@@ -42,15 +89,160 @@ class LobbyManager:
         if game.uuid not in self._games_by_uuid:
             raise KeyError("This game is not registered")
 
-        # Notify lobby if not already in game
-        if not self._games_by_uuid[game.uuid].playing:
-            await self._games_by_uuid[game.uuid].notify_lobby_dispose()
-
         # Remove game
+        self._unlist(self._sequences[game.uuid])
+        del self._games_by_sequence[self._sequences.pop(game.uuid)]
         del self._games_by_uuid[game.uuid]
 
         logging.info("Removed game {}".format(game.uuid))
 
+    def mark_dirty(self, game):
+        """
+        Schedules an update of `game`'s lobby info
+        :param game: `Game` object
+        :return:
+        """
+        self._disposed_games.pop(game.uuid, None)
+        self._dirty_games[game.uuid] = game
+        self._reindex(game)
+        self.version += 1
+        self._schedule_flush()
+
+    def mark_disposed(self, game):
+        """
+        Schedules the removal of `game` from the lobby.
+        Overrides any pending update of the same game.
+        :param game: `Game` object
+        :return:
+        """
+        self._dirty_games.pop(game.uuid, None)
+        self._disposed_games[game.uuid] = None
+        self._reindex(game)
+        self.version += 1
+        self._schedule_flush()
+
+    def _reindex(self, game):
+        """
+        Moves a game to the right free slots bucket, adding it to or removing it from the lobby indexes
+        :param game: `Game` object
+        :return:
+        """
+        sequence = self._sequences.get(game.uuid)
+        if sequence is None:
+            return
+        if game.public and game.state == game_states.LOBBY:
+            # The host can shrink a game below its player count, that's a full game
+            free = max(0, game.max_players - len(game.slots))
+            if self._listed.get(sequence) == free:
+                return
+            if sequence in self._listed:
+                bucket = self._free_buckets[self._listed[sequence]]
+                bucket.pop(bisect.bisect_left(bucket, sequence))
+            else:
+                bisect.insort(self._names, (game.name.lower(), sequence))
+            bisect.insort(self._free_buckets[free], sequence)
+            self._listed[sequence] = free
+        else:
+            self._unlist(sequence)
+
+    def _unlist(self, sequence):
+        free = self._listed.pop(sequence, None)
+        if free is None:
+            return
+        bucket = self._free_buckets[free]
+        bucket.pop(bisect.bisect_left(bucket, sequence))
+        game = self._games_by_sequence[sequence]
+        self._names.pop(bisect.bisect_left(self._names, (game.name.lower(), sequence)))
+
+    def _listed_sequences(self, min_free_slots=0, after=-1):
+        """
+        :return: iterator over the sequence numbers of the listed games
+                 with at least `min_free_slots` free slots, created after `after`, in creation order
+        """
+        def tail(bucket):
+            for i in range(bisect.bisect_right(bucket, after), len(bucket)):
+                yield bucket[i]
+        return heapq.merge(*(tail(v) for k, v in self._free_buckets.items() if k >= min_free_slots and v))
+
+    def query(self, name_prefix="", min_free_slots=0, after=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Returns a page of the listed games, in creation order
+        :param name_prefix: only return games whose name starts with this (case insensitive)
+        :param min_free_slots: only return games with at least this many free slots
+        :param after: cursor returned by the previous page. `None` for the first page.
+        :param limit: maximum number of games to return
+        :return: (list of lobby info dicts, cursor of the next page or `None` if this is the last one)
+        """
+        if after is None:
+            after = -1
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+        if name_prefix:
+            prefix = name_prefix.lower()
+            first = bisect.bisect_left(self._names, (prefix,))
+            last = bisect.bisect_left(self._names, (prefix + "\U0010ffff",))
+            sequences = sorted(
+                sequence for _, sequence in (self._names[i] for i in range(first, last))
+                if sequence > after and self._listed[sequence] >= min_free_slots
+            )
+        else:
+            sequences = self._listed_sequences(min_free_slots, after)
+        page = list(itertools.islice(sequences, limit + 1))
+        next_cursor = page[limit - 1] if len(page) > limit else None
+        return [self._games_by_sequence[x].sio_lobby_info() for x in page[:limit]], next_cursor
+
+    def _schedule_flush(self):
+        if self._flush_timer is None:
+            self._flush_timer = Scheduler().call_later(Config()["LOBBY_FLUSH_INTERVAL"], self.flush)
+
+    async def flush(self):
+        """
+        Sends all the pending lobby changes to the lobby room as a single `lobby_update` event
+        :return:
+        """
+        self._flush_timer = None
+        dirty_games, self._dirty_games = self._dirty_games, {}
+        disposed_games, self._disposed_games = self._disposed_games, {}
+
+        games = []
+        for game_id, game in dirty_games.items():
+            # Lobby info is read now, so multiple changes in the same interval are sent once
+            if game.public and game.state == game_states.LOBBY:
+                games.append(game.sio_lobby_info())
+            else:
+                disposed_games[game_id] = None
+        if not games and not disposed_games:
+            return
+        await Sio().emit("lobby_update", {
+            "version": self.version,
+            "games": games,
+            "disposed": list(disposed_games)
+        }, room="lobby")
+
+    def _update_snapshot(self):
+        if self._snapshot_version == self.version:
+            return
+        self._snapshot = PreEncoded({
+            "version": self.version,
+            "games": [self._games_by_sequence[x].sio_lobby_info() for x in self._listed_sequences()]
+        })
+        self._snapshot_body = self._snapshot.json.encode("utf-8")
+        self._snapshot_version = self.version
+
+    def snapshot(self):
+        """
+        :return: `PreEncoded` snapshot of all the public games in the lobby,
+                 `{"version": ..., "games": [<lobby info>, ...]}`
+        """
+        self._update_snapshot()
+        return self._snapshot
+
+    def snapshot_body(self):
+        """
+        :return: (etag, bytes) tuple, the current snapshot encoded as UTF-8 JSON and its ETag
+        """
+        self._update_snapshot()
+        return '"{}-{}"'.format(self._epoch, self._snapshot_version), self._snapshot_body
+
     def generate_uuid(self):
         """
         Generates a valid and random UUID
@@ -72,3 +264,6 @@ class LobbyManager:
 
     def __contains__(self, item):
         return item in self._games_by_uuid
+
+    def __len__(self):
+        return len(self._games_by_uuid)
@@ -0,0 +1,213 @@
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from singletons.config import Config
+from singletons.scheduler import Timer
+from utils.singleton import singleton
+
+ASYNCIO_PATH = os.path.dirname(asyncio.__file__)
+
+
+class SlowCallback:
+    """
+    A callback that blocked the event loop for longer than `SLOW_CALLBACK_THRESHOLD` seconds
+    """
+    __slots__ = ("duration", "event", "game", "stack")
+
+    def __init__(self, duration, event, game, stack):
+        self.duration = duration
+        self.event = event
+        self.game = game
+        self.stack = stack
+
+    def __str__(self):
+        return "Event loop blocked for {:.3f}s by {} (game {})\n{}".format(
+            self.duration, self.event, self.game, "".join(traceback.format_list(self.stack))
+        )
+
+
+@singleton
+class LoopMonitor:
+    """
+    Measures the event loop lag: how late a callback scheduled every `INTERVAL` seconds actually runs.
+    When the loop is saturated, timers (instruction deadlines, health drain...) fire late by about this much.
+    The latest `SAMPLES` measurements are kept for percentiles.
+
+    A watchdog thread also pings the loop with `call_soon_threadsafe`. If a ping isn't answered within
+    `SLOW_CALLBACK_THRESHOLD` seconds, something is blocking the loop: the watchdog captures the stack of the
+    loop thread while it's still blocked and the loop logs it, with the socket event and game it was working on,
+    as soon as it's free again. The hot paths aren't instrumented at all.
+    """
+    INTERVAL = 0.25
+    SMOOTHING = 0.3     # weight of the latest sample in the moving average
+    SAMPLES = 1024
+    SLOW_CALLBACKS = 32
+
+    def __init__(self):
+        self._loop = None
+        self._handle = None
+        self._expected = None
+
+        self.lag = 0        # exponential moving average, in seconds
+        self.last_lag = 0   # latest sample, in seconds
+        self.samples = 0
+        self.lags = collections.deque(maxlen=self.SAMPLES)
+
+        # Watchdog. Pings are numbered, the watchdog thread only writes `_sent`/`_sent_time`
+        # and the loop only writes `_acked`.
+        self._watchdog = None
+        self._loop_thread = None
+        self._sent = 0
+        self._sent_time = None
+        self._acked = 0
+        self.slow_callbacks = collections.deque(maxlen=self.SLOW_CALLBACKS)
+        self.slow_callback_count = 0
+
+    @property
+    def running(self):
+        return self._handle is not None
+
+    def start(self):
+        """
+        Starts probing the event loop and, if `SLOW_CALLBACK_THRESHOLD` is not 0, the watchdog thread.
+        Must be called from the thread that runs the event loop. Calling it again does nothing.
+        :return:
+        """
+        if self._handle is not None:
+            return
+        self._loop = asyncio.get_event_loop()
+        self._schedule()
+        threshold = Config()["SLOW_CALLBACK_THRESHOLD"]
+        if threshold > 0:
+            self._loop_thread = threading.get_ident()
+            self._watchdog = threading.Thread(target=self._watch, args=(threshold,), name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        # The watchdog thread exits on its next poll
+        self._watchdog = None
+
+    def _schedule(self):
+        self._expected = self._loop.time() + self.INTERVAL
+        self._handle = self._loop.call_at(self._expected, self._probe)
+
+    def _probe(self):
+        self.last_lag = max(0, self._loop.time() - self._expected)
+        self.lag += (self.last_lag - self.lag) * self.SMOOTHING
+        self.lags.append(self.last_lag)
+        self.samples += 1
+        self._schedule()
+
+    def lag_percentile(self, percentile):
+        """
+        :param percentile: 0-100
+        :return: percentile of the recent lag samples, in seconds. `None` if there are no samples.
+        """
+        if not self.lags:
+            return None
+        samples = sorted(self.lags)
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    def _watch(self, threshold):
+        """
+        Watchdog thread body
+        :param threshold: seconds the loop can take to answer a ping
+        :return:
+        """
+        poll = min(0.05, max(0.01, threshold / 4))
+        thread = threading.current_thread()
+        captured = 0
+        while self._watchdog is thread:
+            now = time.monotonic()
+            if self._acked == self._sent:
+                self._sent_time = now
+                self._sent += 1
+                self._loop.call_soon_threadsafe(self._ack, self._sent)
+            elif captured != self._sent and now - self._sent_time > threshold:
+                # Still blocked, take the stack now
+                captured = self._sent
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    frames = []
+                    f = frame
+                    while f is not None:
+                        frames.append(f)
+                        f = f.f_back
+                    self._loop.call_soon_threadsafe(
+                        self._report, self._sent_time, traceback.extract_stack(frame), frames
+                    )
+            time.sleep(poll)
+
+    def _ack(self, ping):
+        self._acked = ping
+
+    def _report(self, blocked_since, stack, frames):
+        """
+        Called in the loop thread when it's free again, with the stack captured while it was blocked
+        :param blocked_since: `time.monotonic()` value of the ping that wasn't answered
+        :param stack: `traceback.StackSummary` of the loop thread
+        :param frames: frame objects of the stack, innermost first
+        :return:
+        """
+        event, game = self._context(frames)
+        slow_callback = SlowCallback(time.monotonic() - blocked_since, event, game, stack)
+        self.slow_callbacks.append(slow_callback)
+        self.slow_callback_count += 1
+        logging.warning(str(slow_callback))
+
+    @staticmethod
+    def _context(frames):
+        """
+        Finds what the loop was working on in a captured stack
+        :param frames: frame objects, innermost first
+        :return: (event, game uuid) tuple. The event is the socket event being handled,
+                 or the name of the callback run by the loop (eg: a timer callback).
+                 Both can be `None`.
+        """
+        event = game = origin = None
+        for frame in reversed(frames):
+            # The callback is the first frame outside asyncio, inside the loop's `_run_once`
+            in_asyncio = frame.f_code.co_filename.startswith(ASYNCIO_PATH)
+            if origin is None and in_asyncio and frame.f_code.co_name == "_run_once":
+                origin = False
+            elif origin is False and not in_asyncio:
+                origin = frame.f_code.co_name
+        for frame in frames:
+            local_variables = frame.f_locals
+            timer = local_variables.get("timer")
+            if event is None and frame.f_code.co_name == "dispatch" and "event" in local_variables:
+                # Compiled socket event dispatcher (see `utils.server.compile_handler`)
+                event = local_variables["event"]
+            elif event is None and type(timer) is Timer:
+                # Scheduler timer callback
+                event = "timer {}".format(getattr(timer.callback, "__qualname__", timer.callback))
+            if game is None:
+                # `Game` objects are recognized by name, importing `server.game` here would be circular
+                for candidate in (
+                    local_variables.get("self"),
+                    local_variables.get("game"),
+                    getattr(local_variables.get("client"), "game", None),
+                    getattr(getattr(timer, "callback", None), "__self__", None)
+                ):
+                    if type(candidate).__name__ == "Game":
+                        game = candidate.uuid
+                        break
+        return event if event is not None else origin or None, game
+
+    def stats(self):
+        return {
+            "lag": self.lag,
+            "lag_p50": self.lag_percentile(50),
+            "lag_p99": self.lag_percentile(99),
+            "lag_max": max(self.lags) if self.lags else None,
+            "slow_callbacks": self.slow_callback_count
+        }
@@ -0,0 +1,134 @@
+import collections
+
+from constants import game_states
+from singletons.admission import Admission
+from singletons.client_manager import ClientManager
+from singletons.grid_pool import GridPool
+from singletons.lobby_manager import LobbyManager
+from singletons.loop_monitor import LoopMonitor
+from singletons.outbox import Outbox
+from singletons.scheduler import Scheduler
+from singletons.sio import Sio
+from utils.metrics import Counter, Histogram, Collector, Registry
+from utils.singleton import singleton
+
+# Game state names, for the `state` label
+STATE_NAMES = {v: k.lower() for k, v in vars(game_states).items() if k.isupper() and type(v) is int}
+
+
+@singleton
+class Metrics:
+    """
+    Process metrics, exposed by the `/metrics` HTTP route in the Prometheus text format.
+    Counters and histograms are updated by the code that does the work,
+    everything else is read from the other singletons when the metrics are scraped.
+    """
+    def __init__(self):
+        self.registry = Registry()
+        register = self.registry.register
+
+        # Socket events
+        self.handler_latency = register(Histogram(
+            "spaceteam_handler_seconds", "Time spent in socket event handlers", labels=("event",)
+        ))
+        register(Collector(
+            "spaceteam_events_handled_total", "Socket events handled, by event name",
+            lambda: {k: sum(v.counts) for k, v in self.handler_latency.series.items()},
+            labels=("event",), metric_type="counter"
+        ))
+        self.throttled_events = register(Counter(
+            "spaceteam_throttled_events_total", "Events refused by the per-client rate limits, by event name", labels=("event",)
+        ))
+        register(Collector(
+            "spaceteam_emits_total", "Socket.io packets sent, by event name (`batch` for batched events)",
+            lambda: {(k,): v for k, v in Sio().emits.items()}, labels=("event",), metric_type="counter"
+        ))
+        register(Collector(
+            "spaceteam_sent_bytes_total", "Encoded socket.io packet bytes sent, by event name",
+            lambda: {(k,): v for k, v in Sio().sent_bytes.items()}, labels=("event",), metric_type="counter"
+        ))
+
+        # Gameplay
+        self.instructions = register(Counter(
+            "spaceteam_instructions_total", "Instructions, by outcome (issued, completed, expired)", labels=("outcome",)
+        ))
+        self.level_ups = register(Counter("spaceteam_level_ups_total", "Levels completed"))
+        self.game_overs = register(Counter("spaceteam_game_overs_total", "Games lost"))
+
+        # Current state
+        register(Collector(
+            "spaceteam_connected_clients", "Connected clients", lambda: len(ClientManager())
+        ))
+        register(Collector(
+            "spaceteam_games", "Registered games, by state", self.games_by_state, labels=("state",)
+        ))
+        register(Collector(
+            "spaceteam_admission_refused_total", "Connections, new games and game starts refused by admission control",
+            lambda: {k: v for k, v in Admission().refused.items()}, labels=("kind", "reason"), metric_type="counter"
+        ))
+        register(Collector(
+            "spaceteam_admission_saturated", "1 if new load is being refused because of the event loop lag",
+            lambda: int(Admission().saturated)
+        ))
+        register(Collector(
+            "spaceteam_loop_lag_seconds", "Event loop lag percentiles over the recent samples",
+            self.loop_lag_quantiles, labels=("quantile",)
+        ))
+        register(Collector(
+            "spaceteam_slow_callbacks_total", "Callbacks that blocked the event loop for too long",
+            lambda: LoopMonitor().slow_callback_count, metric_type="counter"
+        ))
+        register(Collector(
+            "spaceteam_scheduled_timers", "Timers waiting in the scheduler", lambda: len(Scheduler())
+        ))
+
+        # Outbox
+        register(Collector(
+            "spaceteam_outbox_events_total", "Events emitted through the outbox",
+            lambda: Outbox().events, metric_type="counter"
+        ))
+        register(Collector(
+            "spaceteam_outbox_frames_total", "Frames flushed by the outbox",
+            lambda: Outbox().frames, metric_type="counter"
+        ))
+        register(Collector(
+            "spaceteam_outbox_dropped_events_total", "Queued events dropped by coalescing, by event name",
+            lambda: {(k,): v for k, v in Outbox().dropped.items()}, labels=("event",), metric_type="counter"
+        ))
+        register(Collector(
+            "spaceteam_outbox_queued_events", "Events held for slow clients",
+            lambda: Outbox().stats()["queued_events"]
+        ))
+        register(Collector(
+            "spaceteam_outbox_slow_clients", "Clients flagged as slow", lambda: Outbox().slow_clients
+        ))
+        register(Collector(
+            "spaceteam_outbox_disconnected_clients_total", "Slow clients disconnected",
+            lambda: Outbox().disconnected_clients, metric_type="counter"
+        ))
+
+        # Grid pool
+        register(Collector(
+            "spaceteam_grid_pool_requests_total", "Grid set requests, by result (hit, miss)",
+            lambda: {("hit",): GridPool().hits, ("miss",): GridPool().misses}, labels=("result",), metric_type="counter"
+        ))
+
+    @staticmethod
+    def games_by_state():
+        """
+        :return: dict of (state name,) -> number of games
+        """
+        states = collections.Counter(game.state for _, game in LobbyManager().items())
+        return {(name,): states[state] for state, name in STATE_NAMES.items()}
+
+    @staticmethod
+    def loop_lag_quantiles():
+        """
+        :return: dict of (quantile,) -> event loop lag in seconds
+        """
+        if not LoopMonitor().lags:
+            return {}
+        return {(str(x / 100),): LoopMonitor().lag_percentile(x) for x in (50, 90, 99)}
+
+    def render(self):
+        return self.registry.render()
@@ -0,0 +1,283 @@
+import asyncio
+import collections
+import logging
+
+from constants import protocols
+from singletons.client_manager import ClientManager
+from singletons.config import Config
+from singletons.scheduler import Scheduler
+from singletons.sio import Sio
+from utils import json_serializer
+from utils.json_serializer import PreEncoded
+from utils.singleton import singleton
+
+# Events that can be coalesced while they wait in a client queue.
+# "latest" events replace the queued one (only the latest value matters),
+# "toggle" events cancel out with the queued one (two grid flips are no flip at all).
+# All the other events (`command`, `grid`...) are never dropped.
+COALESCED_EVENTS = {
+    "health_info": "latest",
+    "flip_grid": "toggle"
+}
+
+
+class OutboundEvent:
+    """
+    An event waiting in the `Outbox`, shared by all its recipients.
+    Its data is encoded at most once, no matter how many clients receive it.
+    """
+    __slots__ = ("event", "data", "time", "shared", "_payload", "_json")
+
+    def __init__(self, event, data, time, shared):
+        self.event = event
+        self.data = data
+        self.time = time
+        self.shared = shared
+        self._payload = None
+        self._json = None
+
+    @property
+    def payload(self):
+        """
+        :return: data to emit. `PreEncoded` if the event has more recipients.
+        """
+        if not self.shared or self.data is None or type(self.data) is PreEncoded:
+            return self.data
+        if self._payload is None:
+            self._payload = PreEncoded(self.data)
+        return self._payload
+
+    @property
+    def json(self):
+        """
+        :return: the `[event, data]` pair encoded as JSON, for batches
+        """
+        if self._json is None:
+            if self.data is None:
+                self._json = json_serializer.dumps([self.event])
+            else:
+                self._json = "[{},{}]".format(json_serializer.dumps(self.event), json_serializer.dumps(self.payload))
+        return self._json
+
+
+class ClientQueue:
+    """
+    Events waiting to be sent to a client
+    """
+    __slots__ = ("events", "coalesced", "slow_since")
+
+    def __init__(self):
+        self.events = []
+        self.coalesced = {}     # event name -> queued `OutboundEvent`, for `COALESCED_EVENTS`
+        self.slow_since = None
+
+    def bytes(self):
+        return sum(len(x.json) for x in self.events)
+
+
+@singleton
+class Outbox:
+    """
+    Outbound layer between the games and `Sio`.
+    Events emitted during an event loop turn are collected per client and flushed
+    at the end of the turn, sending all the clients their events concurrently.
+    A client with a single pending event gets it as it is. A client with more events gets them one by one
+    or, if its protocol supports it (see `constants.protocols.BATCH`), as a single `batch` event.
+
+    If the engine.io queue of a client is longer than `MAX_BACKLOG` packets, the client is not
+    keeping up: its events are held here, where stale events are coalesced (see `COALESCED_EVENTS`).
+    A client whose held events stay over `SLOW_CLIENT_BYTES` or `SLOW_CLIENT_AGE` seconds is flagged
+    as slow, and disconnected if it's still slow after `SLOW_CLIENT_TIMEOUT` seconds or if it
+    has more than `MAX_QUEUED_EVENTS` events held.
+    """
+    LATENCY_SAMPLES = 4096
+    MAX_BACKLOG = 32
+    MAX_QUEUED_EVENTS = 256
+    RETRY_INTERVAL = 0.1
+
+    def __init__(self):
+        self._queues = collections.OrderedDict()    # sid -> `ClientQueue`, only clients with events
+        self._flush_handle = None
+        self._retry_timer = None
+
+        self.events = 0
+        self.frames = 0
+        self.batched_frames = 0
+        self.frames_per_second = 0
+        self._window_start = None
+        self._window_frames = 0
+
+        self.dropped = collections.Counter()
+        self.slow_clients = 0
+        self.disconnected_clients = 0
+
+        # Seconds from emit to the end of the flush that delivered the event to its last recipient
+        self.latencies = collections.deque(maxlen=self.LATENCY_SAMPLES)
+
+    @staticmethod
+    def _recipients(room, skip_sid):
+        rooms = Sio().manager.rooms.get("/", {})
+        if room not in rooms:
+            return []
+        return [x for x in rooms[room] if x != skip_sid]
+
+    @staticmethod
+    def _backlog(sid):
+        """
+        :return: number of packets in the engine.io queue of `sid`
+        """
+        socket = Sio().eio.sockets.get(sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    async def emit(self, event, data=None, room=None, skip_sid=None):
+        """
+        Queues an event for all the clients in `room`. Same arguments as `Sio().emit`,
+        but `room` is required. Recipients are resolved now, not when the event is flushed.
+        :param event: event name
+        :param data: event data
+        :param room: room name or client sid
+        :param skip_sid: sid of a client in `room` that won't receive the event
+        :return:
+        """
+        if room is None:
+            raise ValueError("Outbox events must have a room")
+        recipients = self._recipients(room, skip_sid)
+        if not recipients:
+            return
+        loop = asyncio.get_event_loop()
+        outbound_event = OutboundEvent(event, data, loop.time(), len(recipients) > 1)
+        policy = COALESCED_EVENTS.get(event)
+        for sid in recipients:
+            queue = self._queues.get(sid)
+            if queue is None:
+                queue = self._queues[sid] = ClientQueue()
+            if policy is not None and event in queue.coalesced:
+                queue.events.remove(queue.coalesced.pop(event))
+                self.dropped[event] += 1
+                if policy == "toggle":
+                    self.dropped[event] += 1
+                    continue
+            queue.events.append(outbound_event)
+            if policy is not None:
+                queue.coalesced[event] = outbound_event
+        self.events += 1
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        now = asyncio.get_event_loop().time()
+        sending = []
+        for sid, queue in list(self._queues.items()):
+            if not queue.events:
+                del self._queues[sid]
+            elif self._backlog(sid) <= self.MAX_BACKLOG:
+                if queue.slow_since is not None:
+                    self.slow_clients -= 1
+                sending.append((sid, queue.events))
+                del self._queues[sid]
+            else:
+                self._hold(sid, queue, now)
+        if sending:
+            asyncio.ensure_future(self._send(sending)).add_done_callback(self._log_exception)
+        if self._queues and self._retry_timer is None:
+            # Some clients are not keeping up, try again later
+            self._retry_timer = Scheduler().call_later(self.RETRY_INTERVAL, self._retry)
+
+    def _retry(self):
+        self._retry_timer = None
+        self.schedule_flush()
+
+    def _hold(self, sid, queue, now):
+        """
+        Keeps a queue for the next flush, flagging and disconnecting the client if it's too slow
+        """
+        too_many = len(queue.events) > self.MAX_QUEUED_EVENTS
+        if queue.slow_since is None:
+            too_big = queue.bytes() > Config()["SLOW_CLIENT_BYTES"]
+            too_old = now - queue.events[0].time > Config()["SLOW_CLIENT_AGE"]
+            if not too_big and not too_old and not too_many:
+                return
+            logging.warning("{} is a slow client ({} events queued)".format(sid, len(queue.events)))
+            queue.slow_since = now
+            self.slow_clients += 1
+        if too_many or now - queue.slow_since > Config()["SLOW_CLIENT_TIMEOUT"]:
+            logging.warning("Disconnecting slow client {}".format(sid))
+            del self._queues[sid]
+            self.slow_clients -= 1
+            self.disconnected_clients += 1
+            asyncio.ensure_future(Sio().disconnect(sid)).add_done_callback(self._log_exception)
+
+    async def _send(self, sending):
+        if len(sending) == 1:
+            await self._send_client(*sending[0])
+        else:
+            await asyncio.gather(*(self._send_client(sid, x) for sid, x in sending))
+
+        # Measurements
+        now = asyncio.get_event_loop().time()
+        events = {id(x): x for _, client_events in sending for x in client_events}
+        self.latencies.extend(now - x.time for x in events.values())
+        self.frames += len(sending)
+        if self._window_start is None:
+            self._window_start = now
+        self._window_frames += len(sending)
+        if now - self._window_start >= 1:
+            self.frames_per_second = self._window_frames / (now - self._window_start)
+            self._window_start = now
+            self._window_frames = 0
+
+    @staticmethod
+    def _batches(sid):
+        """
+        :return: `True` if the client `sid` accepts `batch` events
+        """
+        try:
+            return ClientManager()[sid].protocol >= protocols.BATCH
+        except KeyError:
+            return False
+
+    async def _send_client(self, sid, events):
+        if len(events) == 1:
+            await Sio().emit(events[0].event, events[0].payload, room=sid)
+        elif self._batches(sid):
+            self.batched_frames += 1
+            await Sio().emit("batch", PreEncoded.from_json("[{}]".format(",".join(x.json for x in events))), room=sid)
+        else:
+            for x in events:
+                await Sio().emit(x.event, x.payload, room=sid)
+
+    @staticmethod
+    def _log_exception(future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.error("Unhandled exception while flushing outbox", exc_info=future.exception())
+
+    def latency_percentile(self, percentile):
+        """
+        :param percentile: 0-100
+        :return: percentile of the recent emit to delivery latencies, in seconds. `None` if there are no samples.
+        """
+        if not self.latencies:
+            return None
+        samples = sorted(self.latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    def stats(self):
+        depths = [len(x.events) for x in self._queues.values()]
+        return {
+            "events": self.events,
+            "frames": self.frames,
+            "batched_frames": self.batched_frames,
+            "frames_per_second": self.frames_per_second,
+            "latency_p50": self.latency_percentile(50),
+            "latency_p99": self.latency_percentile(99),
+            "queued_clients": len(depths),
+            "queued_events": sum(depths),
+            "max_queue_depth": max(depths) if depths else 0,
+            "dropped": dict(self.dropped),
+            "slow_clients": self.slow_clients,
+            "disconnected_clients": self.disconnected_clients
+        }
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import math
+
+from utils.singleton import singleton
+
+
+class Timer:
+    """
+    A handle to a callback scheduled on the `Scheduler`.
+    Use `cancel()` to stop it and `Scheduler().reschedule()` to move it.
+    """
+    __slots__ = ("deadline", "tick", "callback", "args", "cancelled")
+
+    def __init__(self, deadline, tick, callback, args):
+        self.deadline = deadline
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        Scheduler().cancel(self)
+
+    @property
+    def active(self):
+        return not self.cancelled and self.tick is not None
+
+
+@singleton
+class Scheduler:
+    """
+    Process-wide hashed timer wheel that owns every game deadline.
+    There's only one asyncio timer handle for the whole process (the next wheel tick),
+    instead of a sleeping asyncio Task per instruction/slot/game.
+    Scheduling, cancelling and rescheduling a `Timer` are O(1).
+    Callbacks can be regular functions or coroutine functions. Coroutines are
+    wrapped in a Task only when the timer fires.
+    """
+    RESOLUTION = 0.1    # seconds per wheel slot
+    WHEEL_SIZE = 512    # slots per wheel revolution (~51 seconds)
+    EARLY_TOLERANCE = 0.001
+
+    def __init__(self, loop=None):
+        self._loop = loop
+        self._wheel = [set() for _ in range(self.WHEEL_SIZE)]
+        self._cursor = None     # last processed tick
+        self._tick_handle = None
+        self._count = 0
+
+        self.fired = 0
+        self.cancelled = 0
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def time(self):
+        """
+        :return: current loop time, the clock all deadlines refer to
+        """
+        return self.loop.time()
+
+    def __len__(self):
+        return self._count
+
+    def call_later(self, delay, callback, *args):
+        """
+        Schedules `callback(*args)` to be called after `delay` seconds
+        :param delay: seconds to wait
+        :param callback: function or coroutine function
+        :return: `Timer` object
+        """
+        return self.call_at(self.time() + delay, callback, *args)
+
+    def call_at(self, deadline, callback, *args):
+        """
+        Schedules `callback(*args)` to be called at loop time `deadline`
+        :param deadline: loop time (see `Scheduler.time()`)
+        :param callback: function or coroutine function
+        :return: `Timer` object
+        """
+        timer = Timer(deadline, None, callback, args)
+        self._insert(timer)
+        return timer
+
+    def reschedule(self, timer, delay):
+        """
+        Moves an existing timer (even if already fired or cancelled) so it fires after `delay` seconds
+        :param timer: `Timer` object
+        :param delay: seconds from now
+        :return: the same `Timer` object
+        """
+        self._remove(timer)
+        timer.deadline = self.time() + delay
+        timer.cancelled = False
+        self._insert(timer)
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancels a timer. Cancelling an already fired or cancelled timer does nothing.
+        :param timer: `Timer` object
+        :return:
+        """
+        if self._remove(timer):
+            self.cancelled += 1
+        timer.cancelled = True
+
+    def _insert(self, timer):
+        if self._cursor is None:
+            self._cursor = self._tick_of(self.time()) - 1
+        elif self._count == 0:
+            # Wheel was idle, restart it from now. Never move the cursor back,
+            # `_run` may be sweeping the current tick.
+            self._cursor = max(self._cursor, self._tick_of(self.time()) - 1)
+        timer.tick = max(self._tick_of(timer.deadline), self._cursor + 1)
+        self._wheel[timer.tick % self.WHEEL_SIZE].add(timer)
+        self._count += 1
+        self._arm()
+
+    def _remove(self, timer):
+        if timer.tick is None:
+            return False
+        self._wheel[timer.tick % self.WHEEL_SIZE].discard(timer)
+        timer.tick = None
+        self._count -= 1
+        if self._count == 0 and self._tick_handle is not None:
+            self._tick_handle.cancel()
+            self._tick_handle = None
+        return True
+
+    def _tick_of(self, t):
+        return int(math.ceil(t / self.RESOLUTION))
+
+    def _arm(self):
+        if self._tick_handle is None and self._count > 0:
+            self._tick_handle = self.loop.call_at((self._cursor + 1) * self.RESOLUTION, self._run)
+
+    def _run(self):
+        self._tick_handle = None
+        # Last tick whose time has passed (tolerate the loop waking up a bit early)
+        now_tick = int(math.floor((self.time() + self.EARLY_TOLERANCE) / self.RESOLUTION))
+
+        # If we're late by more than a whole revolution, visiting every slot once is enough
+        last_tick = min(now_tick, self._cursor + self.WHEEL_SIZE)
+        for tick in range(self._cursor + 1, last_tick + 1):
+            # Timers (re)scheduled by the callbacks below go to a later tick, never to a bucket already swept
+            self._cursor = tick
+            bucket = self._wheel[tick % self.WHEEL_SIZE]
+            if not bucket:
+                continue
+            expired = [x for x in bucket if x.tick is not None and x.tick <= now_tick]
+            for timer in sorted(expired, key=lambda z: z.deadline):
+                # The timer may have been cancelled or rescheduled by a previous callback in this same tick
+                if timer.tick is None or timer.tick > now_tick or timer not in bucket:
+                    continue
+                bucket.discard(timer)
+                timer.tick = None
+                self._count -= 1
+                self._fire(timer)
+        self._cursor = max(self._cursor, now_tick)
+        self._arm()
+
+    def _fire(self, timer):
+        self.fired += 1
+        try:
+            result = timer.callback(*timer.args)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result, loop=self.loop).add_done_callback(self._log_task_exception)
+        except Exception:
+            logging.exception("Unhandled exception in scheduled callback {}".format(timer.callback))
+
+    @staticmethod
+    def _log_task_exception(task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Unhandled exception in scheduled task", exc_info=task.exception())
@@ -1,8 +1,35 @@
+import collections
+import logging
+
 import socketio
+from socketio import packet
 
+from singletons.config import Config
+from utils import json_serializer
 from utils.singleton import singleton
 
 
 @singleton
 class Sio(socketio.AsyncServer):
-    pass
\ No newline at end of file
+    def __init__(self):
+        logging.info("Using {} JSON backend".format(json_serializer.set_backend(Config()["JSON_BACKEND"])))
+        super().__init__(json=json_serializer)
+
+        # Packets and encoded bytes sent, by event name
+        self.emits = collections.Counter()
+        self.sent_bytes = collections.Counter()
+
+    async def _send_packet(self, sid, pkt):
+        """
+        Sends a socket.io packet to a client, counting it by event name
+        """
+        encoded_packet = pkt.encode()
+        if isinstance(encoded_packet, list):
+            # Binary packets, never sent by the game
+            await super()._send_packet(sid, pkt)
+            return
+        if pkt.packet_type == packet.EVENT:
+            event = pkt.data[0]
+            self.emits[event] += 1
+            self.sent_bytes[event] += len(encoded_packet)
+        await self.eio.send(sid, encoded_packet, binary=False)
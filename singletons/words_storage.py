@@ -1,70 +1,78 @@
+import logging
+import os
+
+from singletons.config import Config
 from utils.singleton import singleton
+from utils.words_index import WordsIndex, MappedPairs, compile_words, needs_compiling
 
 
-@singleton
-class WordsStorage:
-    def __init__(self):
-        self.PREFIXES = [
-            "ultra", "super", "mega", "proto", "sub", "pro", "alter", "stra", "de", "iono", "arci", "bio",
-            "mono", "bi", "tri", "quadri", "penta", "esa", "otta", "deca", "multi",
-            "emi", "olo", "pseudo", "termo", "turbo", "ipno", "infra", "astro", "macro", "spettro", "fanta", "tele"
-        ]
+class WordsPack:
+    """
+    Words of a single locale, backed by a memory mapped `WordsIndex`
+    """
+    def __init__(self, locale, index):
+        self.locale = locale
+        self.index = index
 
-        self.MASCULINE = {
-            "rare_nouns": [],
-            "rare_adjectives": [],
-            "nouns": [],
-            "adjectives": []
-        }
+        self.PREFIXES = index["prefixes"]
 
-        self.FEMININE = {
-            "rare_nouns": [],
-            "rare_adjectives": [],
-            "nouns": [],
-            "adjectives": []
+        # Tables used by `CommandNameGenerator`.
+        # Nouns by gender (`True` if masculine) and adjectives are (common, rare) tuples.
+        # Adjectives are (masculine, feminine) tuples.
+        self.noun_tables = {
+            True: (index["nouns_m"], index["rare_nouns_m"]),
+            False: (index["nouns_f"], index["rare_nouns_f"])
         }
+        self.adjective_tables = (
+            MappedPairs(index["adjectives_m"], index["adjectives_f"]),
+            MappedPairs(index["rare_adjectives_m"], index["rare_adjectives_f"])
+        )
+        self.verb_table = index["verbs"]
 
-        self.VERBS = []
 
-    def load_nouns(self):
-        lines = []
-        with open("words/nouns.txt", "r") as f:
-            lines += [(x.lower().strip(), False) for x in f.readlines()]
-        with open("words/rare_nouns.txt", "r") as f:
-            lines += [(x.lower().strip(), True) for x in f.readlines()]
-
-        for (line, rare) in lines:
-            noun, gender = line.split(",")
-            if gender == "f":
-                dest_list = self.FEMININE["{}nouns".format("rare_" if rare else "")]
-            else:
-                dest_list = self.MASCULINE["{}nouns".format("rare_" if rare else "")]
+@singleton
+class WordsStorage:
+    WORDS_DIR = "words"
 
-            dest_list.append(noun)
+    def __init__(self):
+        self.packs = {}
 
-    def load_adjectives(self):
-        lines = []
-        with open("words/adjectives.txt", "r") as f:
-            lines += [(x.lower().strip(), False) for x in f.readlines()]
-        with open("words/rare_adjectives.txt", "r") as f:
-            lines += [(x.lower().strip(), True) for x in f.readlines()]
+    @property
+    def default_locale(self):
+        return Config()["WORDS_LOCALE"]
 
-        for (line, rare) in lines:
-            parts = line.split(",")
-            if len(parts) == 1:
-                # Same for feminine and masculine
-                self.MASCULINE["{}adjectives".format("rare_" if rare else "")].append(line)
-                self.FEMININE["{}adjectives".format("rare_" if rare else "")].append(line)
-            else:
-                # Different feminine and masculine variants
-                self.MASCULINE["{}adjectives".format("rare_" if rare else "")].append(parts[0])
-                self.FEMININE["{}adjectives".format("rare_" if rare else "")].append(parts[1])
+    def available_locales(self):
+        """
+        :return: list of locales that have a words directory
+        """
+        return [x for x in os.listdir(self.WORDS_DIR) if os.path.isdir(os.path.join(self.WORDS_DIR, x))]
 
-    def load_verbs(self):
-        with open("words/verbs.txt", "r") as f:
-            self.VERBS = [x.lower().strip() for x in f.readlines()]
+    def load(self, locale=None):
+        """
+        Loads a locale's words, compiling its index first if it's missing or outdated
+        :param locale: locale name. If `None`, load the default one.
+        :return: `WordsPack` object
+        """
+        if locale is None:
+            locale = self.default_locale
+        source_dir = os.path.join(self.WORDS_DIR, locale)
+        if not os.path.isdir(source_dir):
+            raise ValueError("Unknown words locale {}".format(locale))
+        index_path = os.path.join(self.WORDS_DIR, "{}.idx".format(locale))
+        if needs_compiling(source_dir, index_path):
+            compile_words(source_dir, index_path)
+        self.packs[locale] = WordsPack(locale, WordsIndex(index_path))
+        logging.info("Loaded {} words".format(locale))
+        return self.packs[locale]
 
-    def load(self):
-        self.load_nouns()
-        self.load_adjectives()
-        self.load_verbs()
\ No newline at end of file
+    def pack(self, locale=None):
+        """
+        Returns a locale's words, loading them the first time they're requested
+        :param locale: locale name. If `None`, use the default one.
+        :return: `WordsPack` object
+        """
+        if locale is None:
+            locale = self.default_locale
+        if locale not in self.packs:
+            return self.load(locale)
+        return self.packs[locale]
@@ -7,7 +7,11 @@ from aiohttp import web
 from singletons.config import Config
 from singletons.sio import Sio
 import server
+import server.http_routes
 from singletons.words_storage import WordsStorage
+from singletons.layout_catalogue import LayoutCatalogue
+from singletons.grid_pool import GridPool
+from singletons.loop_monitor import LoopMonitor
 
 HEADER = """
   __  ___  __   ______ _____ ___  __  __ __  
@@ -34,9 +38,19 @@ def main():
     # Load words storage
     WordsStorage().load()
 
+    # Enumerate all grid layouts
+    LayoutCatalogue().load()
+
+    # Start pre-generating grids for all valid numbers of players
+    GridPool().prefill(range(1 if Config()["SINGLE_PLAYER"] else 2, server.Game.MAX_PLAYERS + 1))
+
+    # Start measuring the event loop lag, for admission control
+    LoopMonitor().start()
+
     # Create sio and aiohttp server
     app = web.Application()
     Sio().attach(app)
+    server.http_routes.setup(app)
 
     # Load SSL context
     cert_path = Config()["SSL_CERT"]
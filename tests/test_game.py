@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+import server
+from server.client import Client
+from server.game import Game
+from singletons.client_manager import ClientManager
+from singletons.layout_catalogue import LayoutCatalogue
+from singletons.lobby_manager import LobbyManager
+from singletons.words_storage import WordsStorage
+from utils.singleton import destroy_all
+from utils.special_commands import DummyAsteroidCommand
+
+
+class DefeatSpecialTest(unittest.TestCase):
+    PLAYERS = 2
+
+    def setUp(self):
+        destroy_all()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        WordsStorage().load()
+        LayoutCatalogue().load()
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        destroy_all()
+
+    async def start_game(self):
+        game = Game("Partita", public=True)
+        await LobbyManager().add_game(game)
+        clients = []
+        for player in range(self.PLAYERS):
+            client = Client("player{}".format(player))
+            ClientManager().add_client(client)
+            clients.append(client)
+            await game.join_client(client)
+        for client in clients:
+            await game.ready(client)
+        await game.start()
+        for client in clients:
+            await game.intro_done(client)
+        game.warmup_timer.cancel()
+        await game.warmup_done()
+        return game, clients
+
+    def test_asteroid_after_windows_opened(self):
+        async def run():
+            game, clients = await self.start_game()
+
+            # Everyone is already shaking when the asteroid comes
+            for client in clients:
+                await game.defeat_special(client)
+            slot = game.slots[0]
+            game.difficulty["asteroid_chance"] = 1
+            slot.special_command_cooldown = 0
+            await game.generate_instruction(slot)
+            self.assertIs(type(slot.instruction.target_command), DummyAsteroidCommand)
+
+            # The next press, inside the open window, completes it
+            await game.defeat_special(clients[1])
+            self.assertEqual(game.special_instructions[DummyAsteroidCommand], set())
+            self.assertIsNot(type(slot.instruction.target_command), DummyAsteroidCommand)
+
+            await game.dispose()
+            # Let the outbox flush
+            await asyncio.sleep(0.01)
+        self.loop.run_until_complete(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+
+import server
+from server.client import Client
+from server.game import Game
+from singletons.client_manager import ClientManager
+from singletons.config import Config
+from singletons.layout_catalogue import LayoutCatalogue
+from singletons.lobby_manager import LobbyManager
+from singletons.scheduler import Scheduler
+from singletons.words_storage import WordsStorage
+
+
+def all_tasks():
+    if hasattr(asyncio, "all_tasks"):
+        return asyncio.all_tasks()
+    return asyncio.Task.all_tasks()
+
+
+class GameLifecycleTest(unittest.TestCase):
+    """
+    Plays many games from the lobby to game over on the `Scheduler`
+    and checks that no timer, task or registry entry outlives them
+    """
+    GAMES = 10000
+    PLAYERS = 2
+
+    @classmethod
+    def setUpClass(cls):
+        WordsStorage().load()
+        LayoutCatalogue().load()
+
+    async def play(self, index):
+        game = Game("Partita {}".format(index), public=True)
+        await LobbyManager().add_game(game)
+        clients = []
+        for player in range(self.PLAYERS):
+            client = Client("game{}-player{}".format(index, player))
+            ClientManager().add_client(client)
+            clients.append(client)
+            await game.join_client(client)
+        for client in clients:
+            await game.ready(client)
+        await game.start()
+        self.assertGreater(LobbyManager().games_in_progress, 0)
+
+        # Skip the warmup and drain health fast, so the game is over in about a second
+        game.difficulty["health_drain_rate"] = 50
+        for client in clients:
+            await game.intro_done(client)
+        game.warmup_timer.cancel()
+        await game.warmup_done()
+
+        # Leave a defeat window open (`DEFEAT_WINDOW` is longer than the game), its timer must be cancelled on game over
+        await game.defeat_special(clients[0], black_hole=index % 2 == 0)
+        while game.playing:
+            await asyncio.sleep(0.1)
+
+        # No timer may still point to the finished game
+        pending = [x for bucket in Scheduler()._wheel for x in bucket if getattr(x.callback, "__self__", None) is game]
+        self.assertEqual(pending, [])
+
+        for client in clients:
+            ClientManager().remove_client(client)
+            await client.dispose()
+        return game
+
+    async def play_all(self):
+        games = await asyncio.gather(*(self.play(i) for i in range(self.GAMES)))
+
+        # Let the lobby flush and any pending outbox flush run
+        await asyncio.sleep(Config()["LOBBY_FLUSH_INTERVAL"] + Scheduler().RESOLUTION * 2)
+
+        self.assertTrue(all(not x.playing for x in games))
+        self.assertEqual(len(Scheduler()), 0)
+        self.assertEqual(len(LobbyManager()), 0)
+        self.assertEqual(LobbyManager().games_in_progress, 0)
+        self.assertEqual(len(ClientManager()), 0)
+        self.assertEqual(all_tasks(), {asyncio.Task.current_task() if hasattr(asyncio.Task, "current_task")
+                                       else asyncio.current_task()})
+
+    def test_no_leaks_after_game_over(self):
+        asyncio.get_event_loop().run_until_complete(self.play_all())
+
+
+if __name__ == "__main__":
+    unittest.main()
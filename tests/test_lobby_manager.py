@@ -0,0 +1,60 @@
+import asyncio
+import json
+import unittest
+
+import server
+from server.client import Client
+from server.game import Game
+from singletons.client_manager import ClientManager
+from singletons.lobby_manager import LobbyManager
+from utils.singleton import destroy_all
+
+
+class LobbyManagerTest(unittest.TestCase):
+    def setUp(self):
+        destroy_all()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        destroy_all()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    async def create_game(self, name, players):
+        game = Game(name, public=True)
+        game.max_players = Game.MAX_PLAYERS
+        await LobbyManager().add_game(game)
+        for i in range(players):
+            client = Client("{}-player{}".format(name, i))
+            ClientManager().add_client(client)
+            await game.join_client(client)
+        return game
+
+    def listed_ids(self, **kwargs):
+        games, _ = LobbyManager().query(**kwargs)
+        return [x["game_id"] for x in games]
+
+    def test_shrink_below_player_count(self):
+        async def run():
+            full = await self.create_game("Piena", players=3)
+            other = await self.create_game("Altra", players=1)
+            await full.update_settings(size=2)
+            return full, other
+
+        full, other = self.run_async(run())
+        self.assertEqual((len(full.slots), full.max_players), (3, 2))
+
+        # Still listed, as a full game
+        snapshot = json.loads(LobbyManager().snapshot().json)
+        self.assertEqual([x["game_id"] for x in snapshot["games"]], [full.uuid, other.uuid])
+        self.assertEqual(self.listed_ids(), [full.uuid, other.uuid])
+        self.assertEqual(self.listed_ids(min_free_slots=1), [other.uuid])
+        self.assertEqual(self.listed_ids(name_prefix="pie"), [full.uuid])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import unittest
+
+import server
+from constants import protocols
+from server.client import Client
+from singletons.client_manager import ClientManager
+from singletons.outbox import Outbox
+from singletons.sio import Sio
+from utils.singleton import destroy_all
+
+
+class OutboxTest(unittest.TestCase):
+    def setUp(self):
+        destroy_all()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.sent = []
+
+        async def emit(event, data=None, room=None, **kwargs):
+            if hasattr(data, "json"):
+                data = json.loads(data.json)
+            self.sent.append((room, event, data))
+        Sio().emit = emit
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        destroy_all()
+
+    def connect(self, sid, protocol):
+        ClientManager().add_client(Client(sid, protocol))
+        Sio().manager.enter_room(sid, "/", sid)
+        Sio().manager.enter_room(sid, "/", "game")
+
+    def flush(self):
+        async def emit_and_flush():
+            await Outbox().emit("command", {"text": "Attivare Flusso"}, room="game")
+            await Outbox().emit("next_level", {"level": 2}, room="game")
+            # Let the flush and the send task run
+            await asyncio.sleep(0.01)
+        self.loop.run_until_complete(emit_and_flush())
+
+    def test_batch_only_when_supported(self):
+        self.connect("old", protocols.V1)
+        self.connect("new", protocols.BATCH)
+        self.flush()
+        self.assertEqual([x for x in self.sent if x[0] == "old"], [
+            ("old", "command", {"text": "Attivare Flusso"}),
+            ("old", "next_level", {"level": 2})
+        ])
+        self.assertEqual([x for x in self.sent if x[0] == "new"], [
+            ("new", "batch", [["command", {"text": "Attivare Flusso"}], ["next_level", {"level": 2}]])
+        ])
+        self.assertEqual(Outbox().batched_frames, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
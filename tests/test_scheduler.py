@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from singletons.scheduler import Scheduler
+from utils.singleton import destroy_all
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        destroy_all()
+        self.loop = asyncio.new_event_loop()
+        self.scheduler = Scheduler(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        destroy_all()
+
+    def run_for(self, seconds):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def assert_wheel_empty(self):
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertEqual([x for bucket in self.scheduler._wheel for x in bucket], [])
+
+    def test_fires_in_order(self):
+        fired = []
+        for delay in (0.3, 0.1, 0.2):
+            self.scheduler.call_later(delay, fired.append, delay)
+        self.run_for(0.5)
+        self.assertEqual(fired, [0.1, 0.2, 0.3])
+        self.assert_wheel_empty()
+
+    def test_reschedule_inside_callback(self):
+        # Both timers expire in the same tick, the first one moves the second one 0.2s later
+        fired = {}
+        start = self.scheduler.time()
+        second = self.scheduler.call_later(0.1, lambda: fired.setdefault("second", self.scheduler.time() - start))
+
+        def first():
+            fired["first"] = self.scheduler.time() - start
+            self.scheduler.reschedule(second, 0.2)
+        self.scheduler.call_at(second.deadline - 0.01, first)
+
+        self.run_for(0.2)
+        self.assertIn("first", fired)
+        self.assertNotIn("second", fired)
+        self.assertTrue(second.active)
+        self.assertEqual(len(self.scheduler), 1)
+
+        self.run_for(0.3)
+        self.assertGreaterEqual(fired["second"], fired["first"] + 0.2 - self.scheduler.RESOLUTION)
+        self.assertFalse(second.active)
+        self.assert_wheel_empty()
+
+    def test_schedule_inside_last_callback(self):
+        # The wheel becomes idle while its last callback schedules a new timer
+        fired = []
+        self.scheduler.call_later(0.1, lambda: self.scheduler.call_later(0, fired.append, True))
+        self.run_for(0.4)
+        self.assertEqual(fired, [True])
+        self.assert_wheel_empty()
+
+    def test_cancel_inside_callback(self):
+        fired = []
+        second = self.scheduler.call_later(0.1, fired.append, "second")
+        self.scheduler.call_at(second.deadline - 0.01, second.cancel)
+        self.run_for(0.3)
+        self.assertEqual(fired, [])
+        self.assert_wheel_empty()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,41 +3,83 @@ import random
 from singletons.words_storage import WordsStorage
 
 
+class WordPool:
+    """
+    Draws words without replacement from one or more tiers of words (eg: common and rare ones).
+    Each draw picks a random tier (all tiers have the same weight, exhausted tiers are skipped)
+    and then a random word in that tier.
+    Tiers are never copied: each one is shuffled lazily (Fisher-Yates), storing only the swapped
+    positions, so draws are O(1).
+    """
+    __slots__ = ("tiers", "remaining", "swaps")
+
+    def __init__(self, *tiers):
+        self.tiers = tiers
+        self.remaining = [len(x) for x in tiers]
+        self.swaps = [{} for _ in tiers]
+
+    def __len__(self):
+        return sum(self.remaining)
+
+    def draw(self):
+        """
+        :return: a random word that has not been drawn yet
+        """
+        # Random tier, or the next non exhausted one
+        t = int(random.random() * len(self.tiers))
+        for _ in range(len(self.tiers)):
+            if self.remaining[t] > 0:
+                break
+            t = (t + 1) % len(self.tiers)
+        else:
+            raise RuntimeError("No words left")
+
+        # Swap the drawn position with the last one and shrink the tier
+        n = self.remaining[t]
+        swaps = self.swaps[t]
+        i = int(random.random() * n)
+        word = self.tiers[t][swaps.get(i, i)]
+        swaps[i] = swaps.pop(n - 1, n - 1)
+        self.remaining[t] = n - 1
+        return word
+
+
 class CommandNameGenerator:
-    def __init__(self, words_storage=None):
-        if words_storage is None:
-            words_storage = WordsStorage()
-        self.words_storage = words_storage
-        self.used_nouns = []
-        self.used_adjectives = []
-        self.used_verbs = []
+    def __init__(self, words_pack=None):
+        if words_pack is None:
+            words_pack = WordsStorage().pack()
+        self.words_pack = words_pack
+
+        # Used words are never drawn again by this generator
+        self.nouns = {
+            masculine: WordPool(*self.words_pack.noun_tables[masculine]) for masculine in (True, False)
+        }
+        self.adjectives = WordPool(*self.words_pack.adjective_tables)
+        self.verbs = WordPool(self.words_pack.verb_table)
+
+    def random_masculine(self):
+        """
+        Picks a random gender, falling back to the other one if there are no nouns left
+        :return: `True` if masculine, `False` if feminine
+        """
+        masculine = random.getrandbits(1) == 1
+        if not self.nouns[masculine]:
+            masculine = not masculine
+        return masculine
 
     def random_noun(self, masculine=None):
         if masculine is None:
-            masculine = random.getrandbits(1) == 1
-        if masculine:
-            nouns = random.choice([self.words_storage.MASCULINE["nouns"] * 4, self.words_storage.MASCULINE["rare_nouns"]])
-        else:
-            nouns = random.choice([self.words_storage.FEMININE["nouns"] * 4, self.words_storage.FEMININE["rare_nouns"]])
-        return random.choice(nouns).lower()
+            masculine = self.random_masculine()
+        return self.nouns[masculine].draw()
 
     def random_adjective(self, masculine=None):
         if masculine is None:
             masculine = random.getrandbits(1) == 1
-        if masculine:
-            adjectives = random.choice([self.words_storage.MASCULINE["adjectives"] * 4, self.words_storage.MASCULINE["rare_adjectives"]])
-        else:
-            adjectives = random.choice([self.words_storage.FEMININE["adjectives"] * 4, self.words_storage.FEMININE["rare_adjectives"]])
-        return random.choice(adjectives).lower()
+        return self.adjectives.draw()[0 if masculine else 1]
 
     def generate_compound_noun(self):
-        prefix = random.choice(self.words_storage.PREFIXES).lower()
-
-        while True:
-            noun = self.random_noun()
-            if noun not in self.used_nouns:
-                break
-        self.used_nouns.append(noun)
+        prefix = random.choice(self.words_pack.PREFIXES)
+        noun = self.random_noun()
 
         if prefix.endswith(noun[0]):
             prefix += "-"
@@ -46,15 +88,9 @@ class CommandNameGenerator:
         return "{}{}".format(prefix, noun)
 
     def generate_noun_adjective(self):
-        while True:
-            masculine = random.getrandbits(1) == 1
-            noun = self.random_noun(masculine)
-            adjective = self.random_adjective(masculine)
-            if noun not in self.used_nouns and adjective not in self.used_adjectives:
-                break
-        self.used_nouns.append(noun)
-        self.used_adjectives.append(adjective)
-
+        masculine = self.random_masculine()
+        noun = self.random_noun(masculine)
+        adjective = self.random_adjective(masculine)
         return "{} {}".format(noun, adjective)
 
     def generate_command_name(self):
@@ -64,9 +100,4 @@ class CommandNameGenerator:
             return self.generate_compound_noun()
 
     def generate_action(self):
-        while True:
-            verb = random.choice(self.words_storage.VERBS)
-            if verb not in self.used_verbs:
-                break
-        self.used_verbs.append(verb)
-        return verb
+        return self.verbs.draw()
@@ -3,7 +3,9 @@ import json
 
 from json import JSONEncoder
 
-from constants import layout_cells
+from constants import layout_cells, protocols
+from singletons.layout_catalogue import LayoutCatalogue
+from utils.json_serializer import PreEncoded
 
 NORMAL = 0
 BIG_CELLS = 1
@@ -40,6 +42,21 @@ class GridElement:
             _dict["type"] = TYPES[type(self)]
         return _dict
 
+    def positional(self):
+        """
+        Protocol v2 representation: `[type code, x, y, w, h, name, *type specific fields]`,
+        followed by the additional data dict if there's any
+        :return: list
+        """
+        result = [TYPE_CODES.get(type(self)), self.x, self.y, self.w, self.h, self.name]
+        result.extend(self.positional_fields())
+        if self.additional_data:
+            result.append(self.additional_data)
+        return result
+
+    def positional_fields(self):
+        return []
+
 
 class SliderLikeElement(GridElement):
     def __init__(self, name, x, y, w, h, min_value, max_value):
@@ -57,6 +74,9 @@ class SliderLikeElement(GridElement):
             }
         }
 
+    def positional_fields(self):
+        return [self.min, self.max]
+
 
 class Button(GridElement):
     pass
@@ -87,6 +107,9 @@ class Actions(GridElement):
             }
         }
 
+    def positional_fields(self):
+        return [self.actions]
+
 
 class Switch(GridElement):
     def __init__(self, name, x, y, w, h):
@@ -102,6 +125,16 @@ TYPES = {
     Switch: "switch"
 }
 
+# Type codes used by protocol v2
+TYPE_CODES = {
+    Button: 0,
+    Slider: 1,
+    CircularSlider: 2,
+    Actions: 3,
+    ButtonsSlider: 4,
+    Switch: 5
+}
+
 
 # we will be using a y,x coordinate system;
 # because we're making this for italians not japs:
@@ -111,84 +144,23 @@ class Grid:
     def __init__(self, command_name_generator, pool_config=NORMAL):
         self.grid = [[0,0,0,0],[0,0,0,0],[0,0,0,0],[0,0,0,0]]
         self.objects = []
-        self.command_name_generator = command_name_generator
-
-        while True:
-            print(self.grid)
-            y, x = self.get_next_empty()
-            if y < 0 and x < 0:
-                break
-            print("next empties are: %s, %s" % (y, x))
-            self.add_random_element(y, x)
-
-    def get_next_empty(self):
-        for y in range(4):
-            for x in range(4):
-                if self.grid[y][x] == layout_cells.EMPTY:
-                    return y, x
-        return -1, -1
-
-    def add_random_element(self, y, x):
-        fsr = self.free_space_right(y, x)
-
-        print("for %s, %s; there's %s spaces to the right." % (y, x, fsr))
-
-        if fsr == 1:
-            # No space left on x axis, only Squares and VerticalRectangles allowed
-            pool = [layout_cells.SQUARE, layout_cells.VERTICAL_RECTANGLE]
-        else:
-            # More space, everything can fit
-            pool = [
-                layout_cells.SQUARE, layout_cells.VERTICAL_RECTANGLE,
-                layout_cells.HORIZONTAL_RECTANGLE, layout_cells.BIG_SQUARE
-            ]
-
-        # Remove elements already present in that row
-        # for element in self.grid[y]:
-        #     pool = list(filter(lambda z: z != element, pool))
+        self.objects_by_name = {}
 
-        if y == 3:
-            # No space left on y axis, remove VerticalRectangles and BigSquares from pool
-            pool = list(filter(lambda z: z not in [layout_cells.VERTICAL_RECTANGLE, layout_cells.BIG_SQUARE], pool))
+        # Cached wire payloads by protocol version, see `payload()`, and cached names shown in instructions
+        self._payloads = {}
+        self._encoded_payloads = {}
+        self._display_names = {}
 
-        # Default size is 1
-        length = 1
-
-        # pick something from the pool, or if nothing's left pick a square
-        _type = random.choice(pool) if len(pool) != 0 else layout_cells.SQUARE
-        print("we picked to insert a type %s object there" % _type)
-
-        # if fsr is > 2 and you picked a horizontalrectangle, decide how long it will be.
-        if _type == layout_cells.HORIZONTAL_RECTANGLE:
-            if fsr > 2:
-                length = random.randint(2, 3)
-            else:
-                length = 2
-
-        # if you picked a verticalrectangle, decide how long it will be.
-        if _type == layout_cells.VERTICAL_RECTANGLE:
-            if y <= 1:
-                length = random.randint(2, 3)
-            else:
-                length = 2
-
-        # if you picked a bigsquare, decide how big it will be.
-        if _type == layout_cells.BIG_SQUARE:
-            # if y <= 1 and fsr >= 1 and x <= 1:
-            #     length = random.randint(2, 3)
-            # else:
-            #     length = 2
-            length = 2
-
-        print("and the length will be %s" % length)
+        # Elements not targeted by any active instruction, with their position in `free_objects`
+        self.free_objects = []
+        self._free_positions = {}
+        self.command_name_generator = command_name_generator
 
-        # insert the object
-        self.insert_object(y, x, _type, length)
+        # Sample a precomputed layout and fill it with elements
+        for y, x, _type, length in LayoutCatalogue().sample():
+            self.insert_object(y, x, _type, length)
 
     def insert_object(self, y, x, _type, length):
-        print("inserting a _type %s object of length %s to %s, %s" % (_type, length, y, x))
-
-        # Only the
         self.grid[y][x] = _type
 
         if length != 1:
@@ -261,24 +233,127 @@ class Grid:
                 self.command_name_generator.generate_action() for _ in range(random.randint(2, 4))
             ]
 
-        self.objects.append(_object(**init_kwargs))
-
-    def free_space_right(self, y, x):
-        cnt = 0
-        for i in range(x, 4):
-            if self.grid[y][i] != layout_cells.EMPTY:
-                return cnt
-            cnt += 1
-        return cnt
+        self.add_object(_object(**init_kwargs))
+
+    def add_object(self, element):
+        self.objects.append(element)
+        self.objects_by_name[element.name] = element
+        self.release_object(element)
+
+    def take_free_object(self):
+        """
+        Picks a random element that's not targeted by any instruction and marks it as busy
+        :return: `GridElement` object or `None` if every element is busy
+        """
+        if not self.free_objects:
+            return None
+        i = random.randrange(len(self.free_objects))
+        element = self.free_objects[i]
+
+        # Swap with the last one and pop
+        last = self.free_objects.pop()
+        if last is not element:
+            self.free_objects[i] = last
+            self._free_positions[last] = i
+        del self._free_positions[element]
+        return element
+
+    def release_object(self, element):
+        """
+        Marks an element as not targeted by any instruction.
+        Elements that are already free or that don't belong to this grid are ignored.
+        :param element: `GridElement` object
+        :return:
+        """
+        if element in self._free_positions or self.objects_by_name.get(element.name) is not element:
+            return
+        self._free_positions[element] = len(self.free_objects)
+        self.free_objects.append(element)
+
+    def get_object_at(self, index):
+        """
+        Returns the `GridElement` at position `index` in the grid payload (used by protocol v2)
+        :param index: element index
+        :return: `GridElement` object or `None` if `index` is out of range
+        """
+        if 0 <= index < len(self.objects):
+            return self.objects[index]
+        return None
+
+    def get_object(self, name):
+        """
+        Returns the `GridElement` named `name`
+        :param name: element name
+        :return: `GridElement` object or `None` if there's no such element in this grid
+        """
+        return self.objects_by_name.get(name)
+
+    def rename_object(self, element, name):
+        """
+        Changes an element's name, keeping the name index up to date
+        :param element: `GridElement` object in this grid
+        :param name: new name
+        :return:
+        """
+        if self.objects_by_name.get(element.name) is element:
+            del self.objects_by_name[element.name]
+        element.name = name
+        self.objects_by_name[name] = element
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Drops the cached payload and display names. Call this after changing any element.
+        :return:
+        """
+        self._payloads.clear()
+        self._encoded_payloads.clear()
+        self._display_names.clear()
+
+    def display_name(self, element):
+        """
+        Returns the name of `element` as shown in instructions (with a `$` prefix if it's a symbol)
+        :param element: `GridElement` object
+        :return: cached display name
+        """
+        name = self._display_names.get(element)
+        if name is None:
+            if "symbol" in element.additional_data:
+                name = "${}".format(element.name)
+            else:
+                name = element.name
+            self._display_names[element] = name
+        return name
+
+    def payload(self, protocol=protocols.V1):
+        """
+        :param protocol: protocol version. v1 serializes elements as dicts, v2 as positional lists.
+        :return: list of serialized elements, cached until `invalidate()` is called
+        """
+        payload = self._payloads.get(protocol)
+        if payload is None:
+            if protocol == protocols.V2:
+                payload = [x.positional() for x in self.objects]
+            else:
+                payload = [x.__dict__() for x in self.objects]
+            self._payloads[protocol] = payload
+        return payload
+
+    def encoded_payload(self, protocol=protocols.V1):
+        """
+        :param protocol: protocol version
+        :return: `PreEncoded` payload, cached until `invalidate()` is called
+        """
+        encoded_payload = self._encoded_payloads.get(protocol)
+        if encoded_payload is None:
+            encoded_payload = self._encoded_payloads[protocol] = PreEncoded(self.payload(protocol))
+        return encoded_payload
 
     def jsonify(self):
         return json.dumps(self.objects, cls=GridJSONEncoder)
 
     def __dict__(self):
-        result = []
-        for i in self.objects:
-            result.append(i.__dict__())
-        return result
+        return self.payload()
 
 # if __name__ == "__main__":
 #     print(Grid().jsonify())
@@ -0,0 +1,153 @@
+import json
+import logging
+
+# Optional faster JSON libraries, in order of preference for the "auto" backend
+FAST_BACKENDS = ("orjson", "rapidjson", "ujson")
+
+
+def _json_backend():
+    encoder = json.JSONEncoder(separators=(",", ":"))
+    return encoder.encode, json.loads
+
+
+def _orjson_backend():
+    import orjson
+    options = orjson.OPT_NON_STR_KEYS
+
+    def orjson_dumps(obj):
+        return orjson.dumps(obj, option=options).decode("utf-8")
+    return orjson_dumps, orjson.loads
+
+
+def _rapidjson_backend():
+    import rapidjson
+    return rapidjson.dumps, rapidjson.loads
+
+
+def _ujson_backend():
+    import ujson
+    return ujson.dumps, ujson.loads
+
+
+_BACKENDS = {
+    "json": _json_backend,
+    "orjson": _orjson_backend,
+    "rapidjson": _rapidjson_backend,
+    "ujson": _ujson_backend
+}
+
+# Current backend. All backends produce compact JSON.
+backend = "json"
+_dumps, _loads = _json_backend()
+
+# Encoded packets of events without data (eg: `["safe"]`), by event name
+_constant_packets = {}
+
+
+def available_backends():
+    """
+    :return: list of the names of the installed backends
+    """
+    result = []
+    for name, load in _BACKENDS.items():
+        try:
+            load()
+        except ImportError:
+            continue
+        result.append(name)
+    return result
+
+
+def set_backend(name):
+    """
+    Changes the JSON library used to encode and decode socket.io packets.
+    If the requested library is not installed, the standard `json` module is used.
+    :param name: "json", one of `FAST_BACKENDS` or "auto" (the first fast backend that is installed)
+    :return: name of the backend in use
+    """
+    global backend, _dumps, _loads
+    if name != "auto" and name not in _BACKENDS:
+        raise ValueError("Unknown JSON backend {}".format(name))
+    candidates = FAST_BACKENDS + ("json",) if name == "auto" else (name, "json")
+    for candidate in candidates:
+        try:
+            _dumps, _loads = _BACKENDS[candidate]()
+        except ImportError:
+            if name != "auto":
+                logging.warning("JSON backend {} is not installed, using json".format(name))
+            continue
+        backend = candidate
+        _constant_packets.clear()
+        return backend
+
+
+class PreEncoded:
+    """
+    A value that has already been encoded to JSON.
+    The `dumps` function in this module (used by `Sio`) writes it as it is,
+    so payloads sent many times are encoded only once.
+    """
+    __slots__ = ("json",)
+
+    def __init__(self, obj):
+        self.json = dumps(obj)
+
+    @classmethod
+    def from_json(cls, s):
+        """
+        :param s: JSON string
+        :return: `PreEncoded` object wrapping `s` as it is
+        """
+        result = cls.__new__(cls)
+        result.json = s
+        return result
+
+    def __len__(self):
+        return len(self.json)
+
+
+def _has_pre_encoded(obj, depth=2):
+    """
+    Looks for `PreEncoded` values, at most `depth` levels deep.
+    Two levels are enough for socket.io packets (`[event, data]`) with `PreEncoded` data
+    or `PreEncoded` values in a data dict.
+    """
+    if type(obj) is PreEncoded:
+        return True
+    if depth == 0:
+        return False
+    if type(obj) in (list, tuple):
+        return any(_has_pre_encoded(x, depth - 1) for x in obj)
+    if type(obj) is dict:
+        return any(_has_pre_encoded(x, depth - 1) for x in obj.values())
+    return False
+
+
+def dumps(obj, **kwargs):
+    """
+    `json.dumps` replacement that uses the current backend and splices `PreEncoded` values as they are.
+    The output is always compact, `kwargs` are accepted for compatibility only.
+    """
+    if type(obj) is PreEncoded:
+        return obj.json
+    if type(obj) is list and obj and type(obj[0]) is str:
+        if len(obj) == 1:
+            # Event without data, always the same packet
+            result = _constant_packets.get(obj[0])
+            if result is None:
+                result = _constant_packets[obj[0]] = _dumps(obj)
+            return result
+        if len(obj) == 2 and type(obj[1]) is PreEncoded:
+            # Event with pre-encoded data
+            return "[" + _dumps(obj[0]) + "," + obj[1].json + "]"
+    if not _has_pre_encoded(obj):
+        return _dumps(obj)
+    if type(obj) is dict:
+        return "{{{}}}".format(",".join(
+            "{}:{}".format(_dumps(str(k)), dumps(v)) for k, v in obj.items()
+        ))
+    return "[{}]".format(",".join(dumps(x) for x in obj))
+
+
+def loads(s, **kwargs):
+    return _loads(s)
@@ -0,0 +1,119 @@
+"""
+Compares the old cell by cell grid layout generator with `LayoutCatalogue`.
+Reports how long the catalogue takes to build at startup, then the layouts and grids generated per second
+with each implementation. Grids use real command names, so they include the word sampling cost.
+Run with `python3 -m utils.layout_benchmark`.
+"""
+import random
+import time
+
+from constants import layout_cells
+from singletons.layout_catalogue import LayoutCatalogue
+from singletons.words_storage import WordsStorage
+from utils.command_name_generator import CommandNameGenerator
+from utils.grid import Grid
+
+ITERATIONS = 20000
+
+
+def old_layout():
+    """
+    The layout generator used before `LayoutCatalogue`, without its debug prints.
+    Fills the first empty cell with a random shape until the grid is full.
+    :return: list of (y, x, cell type, length) placements, in placement order
+    """
+    grid = [[layout_cells.EMPTY] * 4 for _ in range(4)]
+    placements = []
+    while True:
+        y, x = next(((y, x) for y in range(4) for x in range(4) if grid[y][x] == layout_cells.EMPTY), (-1, -1))
+        if y < 0 and x < 0:
+            return placements
+
+        fsr = 0
+        for i in range(x, 4):
+            if grid[y][i] != layout_cells.EMPTY:
+                break
+            fsr += 1
+
+        if fsr == 1:
+            pool = [layout_cells.SQUARE, layout_cells.VERTICAL_RECTANGLE]
+        else:
+            pool = [
+                layout_cells.SQUARE, layout_cells.VERTICAL_RECTANGLE,
+                layout_cells.HORIZONTAL_RECTANGLE, layout_cells.BIG_SQUARE
+            ]
+        if y == 3:
+            pool = list(filter(lambda z: z not in [layout_cells.VERTICAL_RECTANGLE, layout_cells.BIG_SQUARE], pool))
+
+        length = 1
+        _type = random.choice(pool) if len(pool) != 0 else layout_cells.SQUARE
+        if _type == layout_cells.HORIZONTAL_RECTANGLE:
+            length = random.randint(2, 3) if fsr > 2 else 2
+        if _type == layout_cells.VERTICAL_RECTANGLE:
+            length = random.randint(2, 3) if y <= 1 else 2
+        if _type == layout_cells.BIG_SQUARE:
+            length = 2
+
+        # Mark the covered cells
+        grid[y][x] = _type
+        if _type == layout_cells.VERTICAL_RECTANGLE:
+            for i in range(y + 1, y + length):
+                grid[i][x] = layout_cells.OCCUPIED
+        elif _type == layout_cells.HORIZONTAL_RECTANGLE:
+            for i in range(x + 1, x + length):
+                grid[y][i] = layout_cells.OCCUPIED
+        elif _type == layout_cells.BIG_SQUARE:
+            grid[y + 1][x] = grid[y][x + 1] = grid[y + 1][x + 1] = layout_cells.BIG_SQUARE
+        placements.append((y, x, _type, length))
+
+
+class OldGrid(Grid):
+    """
+    `Grid` filled by `old_layout()` instead of a catalogue layout
+    """
+    def __init__(self, command_name_generator, pool_config=None):
+        self.grid = [[0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
+        self.objects = []
+        self.objects_by_name = {}
+        self._payloads = {}
+        self._encoded_payloads = {}
+        self._display_names = {}
+        self.free_objects = []
+        self._free_positions = {}
+        self.command_name_generator = command_name_generator
+        for y, x, _type, length in old_layout():
+            self.insert_object(y, x, _type, length)
+
+
+def rate(function):
+    """
+    :return: calls of `function` per second
+    """
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        function()
+    return ITERATIONS / (time.perf_counter() - start)
+
+
+def main():
+    WordsStorage().load()
+
+    start = time.perf_counter()
+    LayoutCatalogue().load()
+    print("Catalogue: {} layouts built in {:.3f}s".format(len(LayoutCatalogue()), time.perf_counter() - start))
+
+    print("{} iterations".format(ITERATIONS))
+    print("{:<12}{:>12}{:>12}".format("generator", "layouts/s", "grids/s"))
+    for name, layout, grid in (
+        ("old", old_layout, OldGrid),
+        ("catalogue", LayoutCatalogue().sample, Grid)
+    ):
+        print("{:<12}{:>12.0f}{:>12.0f}".format(
+            name,
+            rate(layout),
+            rate(lambda: grid(CommandNameGenerator(WordsStorage().pack())))
+        ))
+
+
+if __name__ == "__main__":
+    main()
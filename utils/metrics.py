@@ -0,0 +1,171 @@
+import bisect
+import math
+
+# Default histogram buckets for durations, in seconds
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = ["{}=\"{}\"".format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append("{}=\"{}\"".format(*extra))
+    return "{{{}}}".format(",".join(pairs)) if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if type(value) is float and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Metric:
+    """
+    Base class of all metrics, rendered in the Prometheus text format
+    """
+    TYPE = None
+
+    def __init__(self, name, description, labels=()):
+        """
+        :param name: metric name
+        :param description: `# HELP` text
+        :param labels: label names. Values are passed positionally, in the same order.
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+
+    def samples(self):
+        """
+        :return: iterable of (name suffix, label values tuple, extra label or `None`, value) tuples
+        """
+        raise NotImplementedError()
+
+    def render(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.description),
+            "# TYPE {} {}".format(self.name, self.TYPE)
+        ]
+        for suffix, values, extra, value in self.samples():
+            lines.append("{}{}{} {}".format(
+                self.name, suffix, _format_labels(self.labels, values, extra), _format_value(value)
+            ))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    A value that only goes up. By convention, counter names end with `_total`.
+    Increments are a dict update, with no locking: everything runs in the event loop thread.
+    """
+    TYPE = "counter"
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self.values = {} if labels else {(): 0}
+
+    def inc(self, *labels, amount=1):
+        """
+        :param labels: label values
+        :param amount: increment
+        :return:
+        """
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        return (("", k, None, v) for k, v in sorted(self.values.items()))
+
+
+class HistogramSeries:
+    """
+    Observations of a histogram for one set of label values.
+    Buckets are not cumulative here, so an observation increments a single counter.
+    """
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    """
+    Histogram with fixed buckets. The cumulative counts are computed when the metric is rendered.
+    """
+    TYPE = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+
+    def labeled(self, *labels):
+        """
+        :param labels: label values
+        :return: `HistogramSeries` object for these label values.
+                 Hot paths can keep it and call `observe` on it directly.
+        """
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = HistogramSeries(self.buckets)
+        return series
+
+    def observe(self, value, *labels):
+        self.labeled(*labels).observe(value)
+
+    def samples(self):
+        for values, series in sorted(self.series.items()):
+            total = 0
+            for upper_bound, count in zip(self.buckets + (math.inf,), series.counts):
+                total += count
+                yield "_bucket", values, ("le", _format_value(upper_bound)), total
+            yield "_sum", values, None, series.sum
+            yield "_count", values, None, total
+
+
+class Collector(Metric):
+    """
+    Metric whose values are read from other objects when the metric is rendered
+    """
+    def __init__(self, name, description, function, labels=(), metric_type="gauge"):
+        """
+        :param function: function that returns the value, or a dict of label values tuple -> value
+        :param metric_type: "gauge" or "counter"
+        """
+        super().__init__(name, description, labels)
+        self.function = function
+        self.TYPE = metric_type
+
+    def samples(self):
+        result = self.function()
+        if not self.labels:
+            return [("", (), None, result)]
+        return (("", k, None, v) for k, v in sorted(result.items()))
+
+
+class Registry:
+    """
+    Ordered collection of metrics
+    """
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        :return: all metrics in the Prometheus text exposition format
+        """
+        return "\n".join(x.render() for x in self.metrics) + "\n"
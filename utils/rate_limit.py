@@ -0,0 +1,44 @@
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+    The bucket holds up to `burst` tokens and refills at `rate` tokens per second.
+    Every allowed event takes one token, events that find the bucket empty are refused.
+    """
+    __slots__ = ("rate", "burst", "tokens", "updated", "throttled")
+
+    def __init__(self, rate, burst):
+        """
+        :param rate: tokens added every second
+        :param burst: bucket size, the number of events allowed at once
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # `True` between the first refused event and the next allowed one
+        self.throttled = False
+
+    def take(self, now=None):
+        """
+        Takes a token from the bucket
+        :param now: `time.monotonic()` value. If `None`, use the current time.
+        :return: `True` if the event is allowed, `False` if it must be refused
+        """
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        self.throttled = False
+        return True
+
+    def retry_after(self):
+        """
+        :return: seconds until the next token is available
+        """
+        return max(0, (1 - self.tokens) / self.rate)
@@ -0,0 +1,113 @@
+"""
+Compares the game timers of 1,000 concurrent games implemented with a sleeping asyncio Task
+per timer (as before the timer wheel) and with the `Scheduler` timer wheel.
+Each game has 4 instruction timers, one per slot, rescheduled every time they fire, and a game over timer.
+Reports the live tasks, the timer handles in the event loop and the CPU time spent per second.
+Run with `python3 -m utils.scheduler_benchmark`.
+"""
+import asyncio
+import random
+import time
+
+from singletons.scheduler import Scheduler
+
+GAMES = 1000
+SLOTS = 4
+INSTRUCTION_TIME = 0.5      # shorter than in the real game, so timers fire often during the run
+GAME_OVER_TIME = 60
+DURATION = 5
+
+
+class FiredTimers:
+    fired = 0
+
+    def fire(self, *_):
+        self.fired += 1
+
+
+async def sleeping_tasks(counter):
+    """
+    One task per slot sleeping until its instruction expires, plus one game over task per game
+    :return: list of tasks
+    """
+    async def instruction_loop():
+        while True:
+            await asyncio.sleep(INSTRUCTION_TIME * random.uniform(0.8, 1.2))
+            counter.fire()
+
+    async def game_over():
+        await asyncio.sleep(GAME_OVER_TIME)
+        counter.fire()
+
+    tasks = []
+    for _ in range(GAMES):
+        tasks.extend(asyncio.ensure_future(instruction_loop()) for _ in range(SLOTS))
+        tasks.append(asyncio.ensure_future(game_over()))
+    return tasks
+
+
+async def timer_wheel(counter):
+    """
+    The same timers on the `Scheduler`, rescheduling the same `Timer` objects
+    :return: list of timers
+    """
+    def instruction_expired(slot):
+        counter.fire()
+        Scheduler().reschedule(timers[slot], INSTRUCTION_TIME * random.uniform(0.8, 1.2))
+
+    timers = []
+    for _ in range(GAMES):
+        for _ in range(SLOTS):
+            timers.append(Scheduler().call_later(
+                INSTRUCTION_TIME * random.uniform(0.8, 1.2), instruction_expired, len(timers)
+            ))
+        timers.append(Scheduler().call_later(GAME_OVER_TIME, counter.fire))
+    return timers
+
+
+async def measure(name, start):
+    """
+    Runs a timer implementation for `DURATION` seconds and prints its costs
+    :param name: implementation name
+    :param start: coroutine function that starts the timers
+    :return:
+    """
+    loop = asyncio.get_event_loop()
+    counter = FiredTimers()
+    tasks_before = len(all_tasks())
+    handles = await start(counter)
+    await asyncio.sleep(0)
+
+    cpu = time.process_time()
+    await asyncio.sleep(DURATION)
+    cpu = time.process_time() - cpu
+
+    print("{:<16}{:>8}{:>10}{:>12.1f}{:>10.1f}%".format(
+        name,
+        len(all_tasks()) - tasks_before,
+        len(loop._scheduled),
+        counter.fired / DURATION,
+        cpu / DURATION * 100
+    ))
+
+    # Clean up
+    for x in handles:
+        x.cancel()
+    await asyncio.sleep(0)
+
+
+def all_tasks():
+    if hasattr(asyncio, "all_tasks"):
+        return asyncio.all_tasks()
+    return asyncio.Task.all_tasks()
+
+
+async def main():
+    print("{} games, {} instruction timers and 1 game over timer per game, {}s".format(GAMES, SLOTS, DURATION))
+    print("{:<16}{:>8}{:>10}{:>12}{:>11}".format("timers", "tasks", "handles", "fired/s", "cpu"))
+    await measure("sleeping tasks", sleeping_tasks)
+    await measure("timer wheel", timer_wheel)
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,76 @@
+"""
+Reports the encode cost of every outgoing event type with each installed JSON backend,
+encoding packets the same way socket.io does.
+Run with `python3 -m utils.serializer_benchmark`.
+"""
+import timeit
+
+from singletons.layout_catalogue import LayoutCatalogue
+from singletons.words_storage import WordsStorage
+from utils import json_serializer
+from utils.command_name_generator import CommandNameGenerator
+from utils.grid import Grid
+from utils.json_serializer import PreEncoded
+
+ITERATIONS = 20000
+
+
+def sample_events():
+    """
+    :return: list of (event name, data) tuples, with realistic data for each event type
+    """
+    grid = Grid(CommandNameGenerator(WordsStorage().pack()))
+    lobby_games = [{
+        "name": "Partita {}".format(i),
+        "game_id": "2f1d4a8e-0c43-4c5e-9a8c-52d1f6c0{:04d}".format(i),
+        "players": i % 4,
+        "max_players": 4,
+        "public": True
+    } for i in range(50)]
+    slots = [{"uid": i, "ready": bool(i % 2), "host": i == 0} for i in range(4)]
+    return [
+        ("grid", grid.payload()),
+        ("command", {"text": "Impostare {} a 3".format(grid.objects[0].name), "time": 25, "expired": False}),
+        ("health_info", {
+            "health": 47.318, "death_limit": 12.52, "health_drain_rate": 0.5, "death_limit_increase_rate": 0.05,
+            "max_death_limit": 90, "timestamp": 1530000000.123
+        }),
+        ("next_level", {"level": 3, "modifier": True, "text": "Matrice di riflessione attivata"}),
+        ("game_info", dict(lobby_games[0], slots=slots, sequence=12)),
+        ("game_delta", {"sequence": 13, "slots": slots[1:2]}),
+        ("lobby_update", {"version": 120, "games": lobby_games[:5], "disposed": []}),
+        ("lobby_snapshot", {"version": 120, "games": lobby_games}),
+        ("safe", None),
+        ("game_started", None),
+    ]
+
+
+def encode_cost(event, data):
+    """
+    :return: microseconds to encode a socket.io packet for `event`
+    """
+    packet = [event] if data is None else [event, data]
+    seconds = timeit.timeit(lambda: json_serializer.dumps(packet, separators=(",", ":")), number=ITERATIONS)
+    return seconds / ITERATIONS * 1e6
+
+
+def main():
+    WordsStorage().load()
+    LayoutCatalogue().load()
+    events = sample_events()
+    backends = json_serializer.available_backends()
+
+    header = ["event", "bytes"] + backends + ["pre-encoded"]
+    print("{:<16}{:>8}".format(*header[:2]) + "".join("{:>12}".format(x) for x in header[2:]))
+    for event, data in events:
+        row = []
+        for name in backends:
+            json_serializer.set_backend(name)
+            row.append(encode_cost(event, data))
+        pre_encoded = encode_cost(event, PreEncoded(data)) if data is not None else row[-1]
+        size = len(json_serializer.dumps([event] if data is None else [event, data]))
+        print("{:<16}{:>8}".format(event, size) + "".join("{:>10.2f}us".format(x) for x in row + [pre_encoded]))
+
+
+if __name__ == "__main__":
+    main()
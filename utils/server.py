@@ -1,9 +1,79 @@
 import logging
+import time
 
 import exceptions
 from singletons.client_manager import ClientManager
+from singletons.config import Config
+from singletons.metrics import Metrics
 from singletons.sio import Sio
 from utils.general import str_to_bool, str_is_bool
+from utils.rate_limit import TokenBucket
+
+
+# Argument validators and pre processors by type, built once
+CHECKERS = {
+    int: lambda x, *_: type(x) is int or (type(x) is str and x.isnumeric()),
+    str: lambda x, accept_empty: type(x) is str and (len(x.strip()) > 0 or accept_empty),
+    bool: lambda x, *_: type(x) in [str, int, bool] and str_is_bool(str(x)),
+    list: lambda x, *_: type(x) is list,
+    None: lambda x, *_: True
+}
+
+PRE_PROCESSORS = {
+    int: lambda x: int(x),
+    bool: lambda x: str_to_bool(x)
+}
+
+# Error event sent to the client for each handler exception
+ERRORS = {
+    exceptions.SocketMissingArgumentsError: ("error_missing_arguments", "missing arguments"),
+    exceptions.SocketInvalidArgumentsError: ("error_invalid_arguments", "invalid arguments"),
+    exceptions.SocketUnlinkableClientError: ("error_unlinkable_client", "unlinkable client"),
+    exceptions.SocketNotInGameError: ("error_not_in_game", "not in game"),
+    exceptions.SocketInGameError: ("error_in_game", "in game"),
+    exceptions.SocketIsNotHostError: ("error_is_not_host", "is not host"),
+}
+HANDLED_ERRORS = tuple(ERRORS)
+
+# Game state guards for `handler`
+IN_GAME = "in_game"
+NOT_IN_GAME = "not_in_game"
+IN_GAME_IN_PROGRESS = "in_game_in_progress"
+
+
+class Schema:
+    """
+    Required arguments of an event, compiled once.
+    Arguments are specified like in the `args` decorator.
+    """
+    def __init__(self, *required_args):
+        self.arguments = []
+        for arg in required_args:
+            if type(arg) is tuple:
+                if len(arg) == 2:
+                    arg_name, arg_type, *checker_args = arg + (None,)
+                else:
+                    arg_name, arg_type, *checker_args = arg
+            else:
+                arg_name, arg_type, *checker_args = arg, None, None
+            self.arguments.append((arg_name, CHECKERS[arg_type], tuple(checker_args), PRE_PROCESSORS.get(arg_type)))
+
+    def validate(self, data):
+        """
+        Checks the arguments in `data` and converts them to their type
+        :param data: event data
+        :return:
+        """
+        if type(data) is not dict:
+            data = {}
+        missing = []
+        for arg_name, checker, checker_args, pre_processor in self.arguments:
+            if arg_name not in data or not checker(data[arg_name], *checker_args):
+                missing.append(arg_name)
+            if pre_processor is not None and arg_name in data:
+                data[arg_name] = pre_processor(data[arg_name])
+        if missing:
+            raise exceptions.SocketMissingArgumentsError("Missing argument(s): {}".format(missing))
 
 
 def args(*required_args):
@@ -31,69 +101,162 @@ def args(*required_args):
     :param required_args: required arguments
     :return:
     """
+    schema = Schema(*required_args)
+
     def decorator(f):
         async def wrapper(sid, data=None, *args, **kwargs):
-            missing = []
-            for arg in required_args:
-                if type(arg) is tuple:
-                    if len(arg) == 2:
-                        arg_name, arg_type, *checker_args = arg + (None,)
-                    else:
-                        arg_name, arg_type, *checker_args = arg
-                else:
-                    arg_name, arg_type, *checker_args = arg, None, None
-
-                checkers = {
-                    int: lambda x, *_: type(x) is int or (type(x) is str and x.isnumeric()),
-                    str: lambda x, accept_empty: type(x) is str and (len(x.strip()) > 0 or accept_empty),
-                    bool: lambda x, *_: type(x) in [str, int, bool] and str_is_bool(str(x)),
-                    list: lambda x, *_: type(x) is list,
-                    None: lambda x, *_: True
-                }
-
-                pre_processors = {
-                    int: lambda x: int(x),
-                    bool: lambda x: str_to_bool(x)
-                }
-
-                if arg_name not in data or not checkers[arg_type](data[arg_name], *checker_args):
-                    missing.append(arg_name)
-
-                if arg_type in pre_processors and arg_name in data:
-                    data[arg_name] = pre_processors[arg_type](data[arg_name])
-
-            if missing:
-                raise exceptions.SocketMissingArgumentsError("Missing argument(s): {}".format(missing))
+            schema.validate(data)
             return await f(sid, data, *args, **kwargs)
         return wrapper
     return decorator
 
 
+async def emit_error(sid, e):
+    """
+    Sends the error event corresponding to a handler exception
+    :param sid: client sid
+    :param e: one of the exceptions in `ERRORS`
+    :return:
+    """
+    event, description = ERRORS[type(e)]
+    logging.error("{} raised {}".format(sid, description))
+    await Sio().emit(event, room=sid)
+
+
 def errors(f):
     async def wrapper(sid, data=None, *args, **kwargs):
         try:
             await f(sid, data, *args, **kwargs)
-        except exceptions.SocketMissingArgumentsError:
-            logging.error("{} raised missing arguments".format(sid))
-            await Sio().emit('error_missing_arguments', room=sid)
-        except exceptions.SocketInvalidArgumentsError:
-            logging.error("{} raised invalid arguments".format(sid))
-            await Sio().emit('error_invalid_arguments', room=sid)
-        except exceptions.SocketUnlinkableClientError:
-            logging.error("{} raised unlinkable client".format(sid))
-            await Sio().emit('error_unlinkable_client', room=sid)
-        except exceptions.SocketNotInGameError:
-            logging.error("{} raised not in game".format(sid))
-            await Sio().emit('error_not_in_game', room=sid)
-        except exceptions.SocketInGameError:
-            logging.error("{} raised in game".format(sid))
-            await Sio().emit('error_in_game', room=sid)
-        except exceptions.SocketIsNotHostError:
-            logging.error("{} raised is not host".format(sid))
-            await Sio().emit('error_is_not_host', room=sid)
+        except HANDLED_ERRORS as e:
+            await emit_error(sid, e)
     return wrapper
 
 
+async def throttle(client, event, bucket):
+    """
+    Refuses an event that exceeded the client's rate limit.
+    The client gets a `throttled` event only for the first refused event,
+    the next ones are dropped silently until the limit lets an event through again.
+    :param client: `Client` object
+    :param event: refused event name
+    :param bucket: client's `TokenBucket` for `event`
+    :return:
+    """
+    client.throttled[event] += 1
+    Metrics().throttled_events.inc(event)
+    if bucket.throttled:
+        return
+    bucket.throttled = True
+    logging.warning("{} is sending too many {} events, throttling ({} refused so far)".format(
+        client.sid, event, client.throttled[event]
+    ))
+    await Sio().emit("throttled", {"event": event, "retry_after": bucket.retry_after()}, room=client.sid)
+
+
+def rate_limit(name):
+    """
+    Reads a rate limit from the config
+    :param name: config keys prefix (eg: "COMMAND" for `COMMAND_RATE_LIMIT` and `COMMAND_RATE_BURST`)
+    :return: (rate, burst) tuple, or `None` if the limit is disabled
+    """
+    rate, burst = Config()[name + "_RATE_LIMIT"], Config()[name + "_RATE_BURST"]
+    if rate <= 0:
+        return None
+    return rate, max(1, burst)
+
+
+def compile_handler(f, link=True, guard=None, host=False, schema=None, event=None, limit=None):
+    """
+    Builds a single flat dispatcher for an event handler, equivalent to stacking
+    `base`, `link_client`, the guard decorator, `client_is_host` and `args`
+    :param f: handler coroutine function. Called with `(sid, data, client)`, or `(sid, data)` if `link` is `False`
+    :param link: if `True`, link the sid to its `Client`
+    :param guard: `None`, `IN_GAME`, `NOT_IN_GAME` or `IN_GAME_IN_PROGRESS`
+    :param host: if `True`, the client must be the host of its game
+    :param schema: `Schema` object or `None`
+    :param event: event name, required if `limit` is set. If set, the event is counted in the metrics.
+    :param limit: `None` or (rate, burst) tuple. Each client gets its own `TokenBucket` for `event`,
+                  and events over the limit are refused before any other check.
+    :return: dispatcher coroutine function
+    """
+    if guard not in (None, IN_GAME, NOT_IN_GAME, IN_GAME_IN_PROGRESS):
+        raise ValueError("Invalid guard {}".format(guard))
+    if (guard is not None or host or limit is not None) and not link:
+        raise ValueError("Guards and rate limits need a linked client")
+    if limit is not None and event is None:
+        raise ValueError("Rate limits need an event name")
+    if event is not None:
+        latency = Metrics().handler_latency.labeled(event)
+
+    async def dispatch(sid, data=None, *args):
+        if event is not None:
+            start = time.perf_counter()
+        try:
+            if not link:
+                if schema is not None:
+                    schema.validate(data)
+                return await f(sid, data)
+            try:
+                client = ClientManager()[sid]
+            except (KeyError, ValueError):
+                raise exceptions.SocketUnlinkableClientError()
+            if limit is not None:
+                bucket = client.rate_limits.get(event)
+                if bucket is None:
+                    bucket = client.rate_limits[event] = TokenBucket(*limit)
+                if not bucket.take(time.monotonic()):
+                    await throttle(client, event, bucket)
+                    return
+            if guard == IN_GAME:
+                if not client.is_in_game:
+                    raise exceptions.SocketNotInGameError()
+            elif guard == NOT_IN_GAME:
+                if client.is_in_game:
+                    raise exceptions.SocketInGameError()
+            elif guard == IN_GAME_IN_PROGRESS:
+                if not client.is_in_game or not client.game.playing:
+                    raise exceptions.SocketNotInGameError()
+            if host and not client.is_host:
+                raise exceptions.SocketIsNotHostError()
+            if schema is not None:
+                schema.validate(data)
+            await f(sid, data, client)
+        except HANDLED_ERRORS as e:
+            await emit_error(sid, e)
+        finally:
+            if event is not None:
+                latency.observe(time.perf_counter() - start)
+    return dispatch
+
+
+def handler(event, link=True, guard=None, host=False, args=(), rate_limit_name=None):
+    """
+    Registers an event handler on `Sio` with a compiled dispatcher (see `compile_handler`)
+    ```
+    @server.handler("join_game", guard=server.NOT_IN_GAME, args=[("game_id", str)])
+    async def join_game(sid, data, client):
+        ...
+    ```
+    :param event: event name
+    :param link: if `True`, link the sid to its `Client`
+    :param guard: `None`, `IN_GAME`, `NOT_IN_GAME` or `IN_GAME_IN_PROGRESS`
+    :param host: if `True`, the client must be the host of its game
+    :param args: required arguments, like in the `args` decorator
+    :param rate_limit_name: if not `None`, limit the event rate per client with the limit
+                            of this name in the config (see `rate_limit`)
+    :return:
+    """
+    schema = Schema(*args) if args else None
+    limit = rate_limit(rate_limit_name) if rate_limit_name is not None else None
+
+    def decorator(f):
+        Sio().on(event, compile_handler(
+            f, link=link, guard=guard, host=host, schema=schema, event=event, limit=limit
+        ))
+        return f
+    return decorator
+
+
 def link_client(f):
     async def wrapper(sid, data=None, *args, **kwargs):
         try:
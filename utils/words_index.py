@@ -0,0 +1,183 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"STWI"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")             # magic, version, number of tables
+TABLE_ENTRY = struct.Struct("<II")          # position of the offsets array, number of strings
+OFFSET = struct.Struct("<I")
+
+# Tables stored in every index, in this order.
+# Adjectives are split in two parallel tables (masculine and feminine forms).
+TABLES = [
+    "prefixes",
+    "nouns_m", "rare_nouns_m", "nouns_f", "rare_nouns_f",
+    "adjectives_m", "adjectives_f", "rare_adjectives_m", "rare_adjectives_f",
+    "verbs"
+]
+
+
+def read_lines(path):
+    with open(path, "r") as f:
+        return [x for x in (line.lower().strip() for line in f.readlines()) if x]
+
+
+def parse_words(source_dir):
+    """
+    Parses the text word lists of a locale, removing duplicates
+    :param source_dir: locale directory (eg: `words/it`)
+    :return: dictionary of lists, with the keys in `TABLES`
+    """
+    tables = {x: [] for x in TABLES}
+    tables["prefixes"] = list(dict.fromkeys(read_lines(os.path.join(source_dir, "prefixes.txt"))))
+    tables["verbs"] = list(dict.fromkeys(read_lines(os.path.join(source_dir, "verbs.txt"))))
+
+    # Nouns: "noun,gender" lines. A noun is used only once, even if it's in more lists.
+    seen = set()
+    for prefix in ("", "rare_"):
+        for line in read_lines(os.path.join(source_dir, "{}nouns.txt".format(prefix))):
+            noun, gender = line.split(",")
+            if noun not in seen:
+                seen.add(noun)
+                tables["{}nouns_{}".format(prefix, "f" if gender == "f" else "m")].append(noun)
+
+    # Adjectives: "adjective" or "masculine,feminine" lines
+    seen = set()
+    for prefix in ("", "rare_"):
+        for line in read_lines(os.path.join(source_dir, "{}adjectives.txt".format(prefix))):
+            parts = line.split(",")
+            adjective = (parts[0], parts[-1])
+            if adjective not in seen:
+                seen.add(adjective)
+                tables["{}adjectives_m".format(prefix)].append(adjective[0])
+                tables["{}adjectives_f".format(prefix)].append(adjective[1])
+    return tables
+
+
+def compile_words(source_dir, destination):
+    """
+    Compiles the text word lists of a locale into a binary index:
+    a header, a table directory, one offsets array per table and the UTF-8 string data.
+    Offsets are absolute positions in the file.
+    :param source_dir: locale directory (eg: `words/it`)
+    :param destination: index file path
+    :return:
+    """
+    tables = parse_words(source_dir)
+    encoded = [[x.encode("utf-8") for x in tables[name]] for name in TABLES]
+
+    position = HEADER.size + TABLE_ENTRY.size * len(TABLES)
+    directory = []
+    for strings in encoded:
+        directory.append((position, len(strings)))
+        position += OFFSET.size * (len(strings) + 1)
+
+    offsets = []
+    for strings in encoded:
+        for s in strings:
+            offsets.append(position)
+            position += len(s)
+        offsets.append(position)
+
+    data = bytearray(HEADER.pack(MAGIC, VERSION, len(TABLES)))
+    for entry in directory:
+        data += TABLE_ENTRY.pack(*entry)
+    for offset in offsets:
+        data += OFFSET.pack(offset)
+    for strings in encoded:
+        for s in strings:
+            data += s
+
+    # Write atomically, other processes may be mapping the old file
+    tmp = "{}.tmp{}".format(destination, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, destination)
+    logging.info("Compiled {} into {} ({} bytes)".format(source_dir, destination, len(data)))
+
+
+def needs_compiling(source_dir, destination):
+    """
+    :return: `True` if `destination` doesn't exist or is older than any file in `source_dir`
+    """
+    if not os.path.isfile(destination):
+        return True
+    compiled_time = os.path.getmtime(destination)
+    return any(
+        os.path.getmtime(os.path.join(source_dir, x)) > compiled_time
+        for x in os.listdir(source_dir) if x.endswith(".txt")
+    )
+
+
+class MappedStrings:
+    """
+    Read only sequence of the strings in a table of a memory mapped index.
+    Strings are decoded when accessed.
+    """
+    __slots__ = ("_buffer", "_position", "_count")
+
+    def __init__(self, buffer, position, count):
+        self._buffer = buffer
+        self._position = position
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("string index out of range")
+        start, = OFFSET.unpack_from(self._buffer, self._position + OFFSET.size * i)
+        end, = OFFSET.unpack_from(self._buffer, self._position + OFFSET.size * (i + 1))
+        return self._buffer[start:end].decode("utf-8")
+
+
+class MappedPairs:
+    """
+    Read only sequence of tuples of the strings at the same index in two tables
+    """
+    __slots__ = ("_first", "_second")
+
+    def __init__(self, first, second):
+        self._first = first
+        self._second = second
+
+    def __len__(self):
+        return len(self._first)
+
+    def __getitem__(self, i):
+        return self._first[i], self._second[i]
+
+
+class WordsIndex:
+    """
+    A compiled words index, memory mapped read only so all processes share the same pages
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, tables_count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION or tables_count != len(TABLES):
+            raise ValueError("{} is not a valid words index".format(path))
+
+        self.tables = {}
+        for i, name in enumerate(TABLES):
+            position, count = TABLE_ENTRY.unpack_from(self._mmap, HEADER.size + TABLE_ENTRY.size * i)
+            self.tables[name] = MappedStrings(self._mmap, position, count)
+
+    def __getitem__(self, item):
+        return self.tables[item]
+
+
+if __name__ == "__main__":
+    # Build step: compile every locale in the words directory (or the one passed as argument)
+    logging.getLogger().setLevel(logging.INFO)
+    words_dir = sys.argv[1] if len(sys.argv) > 1 else "words"
+    for locale in sorted(os.listdir(words_dir)):
+        if os.path.isdir(os.path.join(words_dir, locale)):
+            compile_words(os.path.join(words_dir, locale), os.path.join(words_dir, "{}.idx".format(locale)))